@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from auth.dependencies import get_current_superuser
+from core import profiler
+from emails import retention
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+def _collapsed_response(data: str, filename: str) -> PlainTextResponse:
+    return PlainTextResponse(data, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.post("/profile")
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=120),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    user=Depends(get_current_superuser),
+):
+    try:
+        result = await profiler.profile_process(seconds, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return _collapsed_response(result.collapsed(), profiler.profile_filename("process", result.started_at))
+
+
+@router.get("/profiles/{profile_id}")
+async def download_request_profile(profile_id: str, user=Depends(get_current_superuser)):
+    data = profiler.profiles.get(profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _collapsed_response(data, f"request-{profile_id}.collapsed")
+
+
+@router.post("/retention/run")
+async def run_retention(user=Depends(get_current_superuser)):
+    try:
+        return await retention.run_retention()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
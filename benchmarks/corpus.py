@@ -0,0 +1,87 @@
+import json
+import random
+from email.message import EmailMessage
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, List
+
+FIRST_NAMES = ["Ayşe", "Mehmet", "Zeynep", "Ahmet", "Elif", "Mustafa", "Şule", "Gökhan", "İbrahim", "Çağla", "Özge", "Ümit"]
+LAST_NAMES = ["Yılmaz", "Kaya", "Demir", "Şahin", "Çelik", "Yıldız", "Öztürk", "Aydın", "Arslan", "Doğan"]
+DOMAINS = ["example.com", "ornek.com.tr", "mail.test", "firma.net"]
+CHARSETS = ["utf-8", "utf-8", "utf-8", "iso-8859-9", "windows-1254"]
+TRANSFER_ENCODINGS = ["base64", "quoted-printable", "8bit"]
+BOGUS_CHARSET = "x-unknown-turkish"
+BASE_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def load_bodies(training_file: str = "training_data.json") -> List[str]:
+    with open(training_file, "r", encoding="utf-8") as f:
+        return [item["body"] for item in json.load(f)]
+
+
+def _address(rng: random.Random) -> str:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    local = f"{first}.{last}".lower().translate(str.maketrans("çğıöşüİ", "cgiosui"))
+    return f"{first} {last} <{local}@{rng.choice(DOMAINS)}>"
+
+
+def _body_text(rng: random.Random, bodies: List[str], index: int) -> str:
+    paragraphs = [rng.choice(bodies) for _ in range(rng.randint(1, 4))]
+    paragraphs.append(f"Sipariş no: {100000 + index}")
+    return "\n\n".join(paragraphs)
+
+
+def build_message(rng: random.Random, bodies: List[str], index: int, recipient: str = None,
+                  sent_at: datetime = None) -> bytes:
+    text = _body_text(rng, bodies, index)
+    charset = rng.choice(CHARSETS)
+    msg = EmailMessage()
+    subject = text.split("\n", 1)[0][:60]
+    msg["Subject"] = subject
+    msg["From"] = _address(rng)
+    msg["To"] = recipient or _address(rng)
+    msg["Date"] = format_datetime(sent_at or BASE_DATE + timedelta(minutes=index))
+    msg["Message-ID"] = f"<{index}.{rng.getrandbits(32):08x}@mailer.test>"
+
+    roll = rng.random()
+    cte = rng.choice(TRANSFER_ENCODINGS)
+    if roll < 0.05:
+        msg.set_content(text.encode("utf-8"), "text", "plain", cte="base64")
+        msg.set_param("charset", BOGUS_CHARSET)
+    else:
+        msg.set_content(text, charset=charset if _encodable(text, charset) else "utf-8", cte=cte)
+    if 0.05 <= roll < 0.45:
+        msg.add_alternative(f"<html><body><p>{text.replace(chr(10), '<br>')}</p></body></html>", subtype="html")
+    if roll >= 0.7:
+        size = rng.choice([2048, 16384, 131072])
+        msg.add_attachment(rng.randbytes(size), maintype="application", subtype="pdf", filename=f"fatura-{index}.pdf")
+    if roll >= 0.9:
+        msg.add_attachment("ek not\n" * 20, subtype="plain", filename="not.txt")
+    for n, part in enumerate(msg.walk()):
+        if part.is_multipart():
+            part.set_boundary(f"===={index}.{n}====")
+    return msg.as_bytes()
+
+
+def _encodable(text: str, charset: str) -> bool:
+    try:
+        text.encode(charset)
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def generate_messages(count: int, seed: int = 1234, bodies: List[str] = None, recipient: str = None) -> Iterator[bytes]:
+    rng = random.Random(seed)
+    bodies = bodies or load_bodies()
+    for i in range(count):
+        yield build_message(rng, bodies, i, recipient=recipient)
+
+
+def write_eml_dir(path: str, count: int, seed: int = 1234) -> Path:
+    out = Path(path)
+    out.mkdir(parents=True, exist_ok=True)
+    for i, raw in enumerate(generate_messages(count, seed=seed)):
+        (out / f"{i:08d}.eml").write_bytes(raw)
+    return out
@@ -0,0 +1,77 @@
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = REPO_ROOT / "benchmarks" / "baseline.json"
+
+
+def bootstrap_env() -> Path:
+    """Point settings at a throwaway SQLite database so benchmarks never touch real services"""
+    workdir = Path(tempfile.mkdtemp(prefix="mailer-bench-"))
+    os.chdir(REPO_ROOT)
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir / 'bench.db'}"
+    os.environ.setdefault("PROJECT_NAME", "mailer-bench")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("FERNET_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())
+    return workdir
+
+
+@dataclass
+class Result:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool
+
+    def format(self) -> str:
+        return f"{self.value:,.4f} {self.unit}" if self.value < 100 else f"{self.value:,.1f} {self.unit}"
+
+
+def best_of(fn: Callable[[], None], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def median_of(timings: List[float]) -> float:
+    return statistics.median(timings)
+
+
+def load_baseline(path: Path) -> Tuple[Dict[str, Any], Dict[str, dict]]:
+    """The run parameters the baseline was recorded with, and its results by name"""
+    if not path.exists():
+        return {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("parameters", {}), data.get("results", {})
+
+
+def save_baseline(path: Path, parameters: Dict[str, Any], results: List[Result]):
+    recorded, data = load_baseline(path)
+    if recorded != parameters:
+        # Results recorded with other parameters are not comparable with these.
+        data = {}
+    data.update({r.name: asdict(r) for r in results})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"parameters": parameters, "results": data}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def change_ratio(result: Result, baseline: dict) -> float:
+    """Positive when the result is worse than the baseline"""
+    old = baseline["value"]
+    if old == 0:
+        return 0.0
+    delta = (result.value - old) / old
+    return -delta if result.higher_is_better else delta
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+from benchmarks.harness import (
+    DEFAULT_BASELINE, Result, best_of, bootstrap_env, change_ratio, load_baseline, median_of, save_baseline,
+)
+
+BENCHMARKS: Dict[str, Callable] = {}
+BENCH_MAILBOX = "bench@mailer.test"
+
+
+def benchmark(name: str):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def _texts(count: int) -> List[str]:
+    from benchmarks.corpus import load_bodies
+    bodies = load_bodies()
+    return [bodies[i % len(bodies)] + f" #{i}" for i in range(count)]
+
+
+def _poller_emails(count: int) -> List[dict]:
+    from benchmarks.corpus import generate_messages
+    from emails.parsing import parse_message
+    emails = []
+    for raw in generate_messages(count):
+        parsed = parse_message(raw)
+        emails.append({"subject": parsed["subject"], "from": parsed["sender"], "body": parsed["body"], "date": parsed["date"]})
+    return emails
+
+
+@benchmark("analysis")
+def bench_analysis(args) -> List[Result]:
+    from emails.analysis import MailAnalyzer
+    train = best_of(lambda: MailAnalyzer("training_data.json"), args.repeat)
+    analyzer = MailAnalyzer("training_data.json")
+    texts = _texts(args.emails)
+    single = best_of(lambda: [analyzer.predict_detailed(t) for t in texts], args.repeat)
+    batch = best_of(lambda: analyzer.predict_detailed_batch(texts), args.repeat)
+    return [
+        Result("analysis.train_seconds", train, "s", False),
+        Result("analysis.single_throughput", len(texts) / single, "emails/s", True),
+        Result("analysis.batch_throughput", len(texts) / batch, "emails/s", True),
+    ]
+
+
+@benchmark("ai")
+def bench_ai(args) -> List[Result]:
+    from emails.ai import EmailAnalyzer
+
+    def train():
+        EmailAnalyzer().train_from_file("training_data.json")
+
+    train_seconds = best_of(train, args.repeat)
+    analyzer = EmailAnalyzer()
+    analyzer.train_from_file("training_data.json")
+    texts = _texts(args.emails)
+    single = best_of(lambda: [analyzer.predict_detailed(t) for t in texts], args.repeat)
+    return [
+        Result("ai.train_seconds", train_seconds, "s", False),
+        Result("ai.single_throughput", len(texts) / single, "emails/s", True),
+    ]
+
+
+@benchmark("cascade")
+def bench_cascade(args) -> List[Result]:
+    from emails import dedup
+    from emails.analysis import get_analyzer
+
+    analyzer = get_analyzer()
+    texts = _texts(args.emails)
+
+    def full():
+        dedup._registry = None
+        return [(i, a, c) for i, (a, c) in enumerate(dedup.analyze_with_dedup(analyzer, 1, t) for t in texts)
+                if a["priority"] == "yüksek"]
+
+    def cascade():
+        dedup._registry = None
+        return dedup.filter_with_dedup(analyzer, 1, texts, "priority", "yüksek")
+
+    # Runs with the configured settings, near-duplicate detection included; each run starts from an empty registry.
+    try:
+        assert full() == cascade()
+        full_seconds = best_of(full, args.repeat)
+        cascade_seconds = best_of(cascade, args.repeat)
+    finally:
+        dedup._registry = None
+    return [
+        Result("cascade.full_throughput", len(texts) / full_seconds, "emails/s", True),
+        Result("cascade.filter_throughput", len(texts) / cascade_seconds, "emails/s", True),
+    ]
+
+
+@benchmark("mime")
+def bench_mime(args) -> List[Result]:
+    from benchmarks.corpus import generate_messages
+    from emails.parsing import parse_message
+    messages = list(generate_messages(args.emails))
+    total_bytes = sum(len(m) for m in messages)
+    elapsed = best_of(lambda: [parse_message(m) for m in messages], args.repeat)
+    return [
+        Result("mime.parse_throughput", len(messages) / elapsed, "emails/s", True),
+        Result("mime.parse_bandwidth", total_bytes / elapsed / 1e6, "MB/s", True),
+    ]
+
+
+async def _reset_database():
+    import auth.models  # noqa: F401
+    import emails.models  # noqa: F401
+    from sqlalchemy import text
+    from core.database import Base, engine
+    from emails.search import ensure_search_index
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS emails_fts"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_search_index(conn)
+
+
+async def _create_bench_user():
+    from auth.models import User
+    from core.database import async_session
+    async with async_session() as db:
+        user = User(email=BENCH_MAILBOX, hashed_password="x")
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        return user
+
+
+async def _bench_store(args) -> List[Result]:
+    from core.database import engine
+    from emails.analysis import get_analyzer
+    from emails.pipeline import IngestItem, IngestPipeline
+    emails = _poller_emails(args.emails)
+    analyses = get_analyzer().predict_detailed_batch([e["body"] for e in emails])
+    # The ingest pipeline's persist stage, in its configured batch size; no workers are started.
+    pipeline = IngestPipeline()
+    timings = []
+    for _ in range(args.repeat):
+        await _reset_database()
+        user = await _create_bench_user()
+        items = [IngestItem(user.id, BENCH_MAILBOX, analysis=analysis, parsed={
+            "sender": e["from"], "to": BENCH_MAILBOX, "subject": e["subject"], "body": e["body"]})
+            for e, analysis in zip(emails, analyses)]
+        start = time.perf_counter()
+        for i in range(0, len(items), pipeline.persist_batch):
+            await pipeline._persist(items[i:i + pipeline.persist_batch])
+        timings.append(time.perf_counter() - start)
+    await engine.dispose()
+    return [Result("store.insert_rate", len(emails) / min(timings), "emails/s", True)]
+
+
+@benchmark("store")
+def bench_store(args) -> List[Result]:
+    return asyncio.run(_bench_store(args))
+
+
+class _StaticPoller:
+    def __init__(self, emails: List[dict]):
+        self.emails = emails
+
+    def get_emails(self):
+        return self.emails
+
+
+async def _bench_endpoint(args) -> List[Result]:
+    import httpx
+    from main import app
+    from auth.dependencies import get_current_user
+    from core.admission import admission_disabled
+    from emails import router as email_router
+
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=1, email=BENCH_MAILBOX, is_superuser=False)
+    email_router.pollers[BENCH_MAILBOX] = _StaticPoller(_poller_emails(args.emails))
+    timings = []
+    try:
+        transport = httpx.ASGITransport(app=app)
+        # Measures raw throughput; repeated runs would otherwise exhaust the bench user's quota.
+        with admission_disabled():
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                response = await client.get("/mail/analyze", params={"email": BENCH_MAILBOX})
+                response.raise_for_status()
+                for _ in range(max(args.repeat, 5)):
+                    start = time.perf_counter()
+                    response = await client.get("/mail/analyze", params={"email": BENCH_MAILBOX})
+                    response.raise_for_status()
+                    timings.append(time.perf_counter() - start)
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+        email_router.pollers.pop(BENCH_MAILBOX, None)
+    p50 = median_of(timings)
+    return [
+        Result("endpoint.analyze_p50_seconds", p50, "s", False),
+        Result("endpoint.analyze_throughput", args.emails / p50, "emails/s", True),
+    ]
+
+
+@benchmark("endpoint")
+def bench_endpoint(args) -> List[Result]:
+    return asyncio.run(_bench_endpoint(args))
+
+
+def _describe(parameters: Dict[str, object]) -> str:
+    return " ".join(f"--{name} {value}" for name, value in sorted(parameters.items())) or "unknown parameters"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline performance benchmarks and compare them to a baseline.")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)}).")
+    parser.add_argument("--emails", type=int, default=500, help="Number of emails per benchmark (default: 500).")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions; the best run is reported (default: 3).")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline JSON file.")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative slowdown that counts as a regression (default: 0.15).")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results into the baseline file.")
+    args = parser.parse_args()
+
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    bootstrap_env()
+    parameters = {"emails": args.emails, "repeat": args.repeat}
+    recorded, baseline = load_baseline(args.baseline)
+    if baseline and recorded != parameters:
+        print(f"[!] Not comparing with {args.baseline}: it was recorded with {_describe(recorded)}, "
+              f"this run uses {_describe(parameters)}")
+        baseline = {}
+    results: List[Result] = []
+    regressions = []
+    for name in args.names or BENCHMARKS:
+        for result in BENCHMARKS[name](args):
+            results.append(result)
+            line = f"{result.name:<36} {result.format():>22}"
+            if result.name in baseline:
+                ratio = change_ratio(result, baseline[result.name])
+                line += f"   {-ratio:+.1%} vs baseline"
+                if ratio > args.threshold:
+                    regressions.append(result.name)
+                    line += "  REGRESSION"
+            print(line, flush=True)
+
+    if args.update_baseline:
+        save_baseline(args.baseline, parameters, results)
+        print(f"[+] Baseline written to {args.baseline}")
+    if regressions:
+        print(f"[!] {len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from benchmarks.harness import best_of, bootstrap_env
+
+
+def _numpy_typed(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """The analysis as predict_detailed used to return it, with numpy scalars"""
+    typed = {k: np.str_(v) for k, v in analysis.items() if k != "confidence_score"}
+    typed["confidence_score"] = np.float64(analysis["confidence_score"])
+    return typed
+
+
+def build_payload(count: int) -> List[Dict[str, Any]]:
+    from benchmarks.run import _poller_emails
+    from emails.analysis import get_analyzer
+
+    emails = _poller_emails(count)
+    analyses = get_analyzer().predict_detailed_batch([e["body"] for e in emails])
+    return [{
+        "subject": e["subject"], "sender": e["from"], "to": "bench@mailer.test", "date": e["date"], "body": e["body"],
+        "analysis": a, "cluster_id": None,
+    } for e, a in zip(emails, analyses)]
+
+
+def serialize_untyped(payload) -> bytes:
+    # Route without response_model: jsonable_encoder walks every value, then json.dumps renders it.
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def serialize_typed(adapter, payload) -> bytes:
+    # Route with response_model: pydantic-core validates and dumps, the response class renders with orjson.
+    from core.responses import TimedJSONResponse
+    return TimedJSONResponse(adapter.dump_python(adapter.validate_python(payload), mode="json")).body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization time of /mail/analyze payloads, before and after.")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1000, 10000], help="Emails per payload.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sample", type=int, default=500,
+                        help="Emails classified one by one to estimate the endpoint's analysis time.")
+    args = parser.parse_args()
+
+    bootstrap_env()
+    from pydantic import TypeAdapter
+    from emails.analysis import get_analyzer
+    from emails.router import AnalyzedEmail
+
+    adapter = TypeAdapter(List[AnalyzedEmail])
+    analyzer = get_analyzer()
+    print(f"{'emails':>8}{'analysis s':>12}{'before s':>10}{'after s':>10}{'speedup':>9}{'share before':>14}{'share after':>13}")
+    for size in args.sizes:
+        after_payload = build_payload(size)
+        before_payload = [dict(e, analysis=_numpy_typed(e["analysis"])) for e in after_payload]
+        assert serialize_untyped(before_payload) == serialize_typed(adapter, after_payload)
+        # /mail/analyze classifies one email at a time; extrapolate from a sample.
+        sample = [e["body"] for e in after_payload[:args.sample]]
+        start = time.perf_counter()
+        for text in sample:
+            analyzer.predict_detailed(text)
+        analysis = (time.perf_counter() - start) * size / len(sample)
+        before = best_of(lambda: serialize_untyped(before_payload), args.repeat)
+        after = best_of(lambda: serialize_typed(adapter, after_payload), args.repeat)
+        print(f"{size:>8}{analysis:>12.3f}{before:>10.4f}{after:>10.4f}{before / after:>8.1f}x"
+              f"{before / (analysis + before):>14.1%}{after / (analysis + after):>13.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks.harness import REPO_ROOT
+from emails.training import HEADS
+
+
+def write_corpus(data: List[dict], size: int, seed: int, path: Path):
+    """Writes size examples as JSONL, each a training example with extra words and a unique token mixed in"""
+    rng = random.Random(seed)
+    words = [w for x in data for w in x["body"].split()]
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(size):
+            example = dict(data[i % len(data)])
+            extra = " ".join(rng.choice(words) for _ in range(rng.randint(5, 40)))
+            example["body"] = f"{example['body']} {extra} ref{rng.randrange(size)}"
+            f.write(json.dumps(example, ensure_ascii=False) + "\n")
+
+
+def train_in_memory(path: Path):
+    """What MailAnalyzer._train did before: load everything, then fit the heads one after another"""
+    from sklearn.naive_bayes import MultinomialNB
+    from emails.preprocessing import build_vectorizer
+
+    with open(path, "r", encoding="utf-8") as f:
+        data = [json.loads(line) for line in f]
+    X = build_vectorizer().fit_transform([x["body"] for x in data])
+    for head in HEADS:
+        MultinomialNB().fit(X, [x[head] for x in data])
+
+
+def train_streaming(path: Path, jobs: int, chunk_size: int):
+    from sklearn.naive_bayes import MultinomialNB
+    from emails.preprocessing import build_vectorizer
+    from emails.training import fit_streaming
+
+    return fit_streaming(build_vectorizer(), {head: MultinomialNB() for head in HEADS}, path, jobs, chunk_size)[1]
+
+
+def measure(fn: Callable[[], object]):
+    """Wall time, and peak Python allocations of this process only; joblib worker processes are not traced"""
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training time and peak memory of this process across corpus sizes.")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1000, 10000, 50000], help="Corpus sizes.")
+    parser.add_argument("--training-file", default=str(REPO_ROOT / "training_data.json"))
+    parser.add_argument("--jobs", type=int, default=0, help="Streaming workers (default: one per core).")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with open(args.training_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    workdir = Path(tempfile.mkdtemp(prefix="mailer-train-"))
+    jobs = args.jobs or os.cpu_count() or 1
+    # Keep sklearn's import time out of the first measurement.
+    train_streaming(Path(args.training_file), 1, args.chunk_size)
+
+    if jobs > 1:
+        print(f"Peak memory is traced in this process only; the {jobs} worker processes of streaming/{jobs} "
+              "count their chunks outside it.")
+    print(f"{'size':>8}{'mode':>14}{'seconds':>10}{'parent MB':>11}  stages")
+    for size in args.sizes:
+        path = workdir / f"corpus-{size}.jsonl"
+        write_corpus(data, size, args.seed, path)
+        seconds, peak = measure(lambda: train_in_memory(path))
+        print(f"{size:>8}{'in-memory':>14}{seconds:>10.3f}{peak / 2 ** 20:>11.1f}")
+        for n_jobs in sorted({1, jobs}):
+            reports = []
+            seconds, peak = measure(lambda: reports.append(train_streaming(path, n_jobs, args.chunk_size)))
+            stages = ", ".join(f"{stage} {value:.3f}" for stage, value in reports[0].timings.items())
+            print(f"{size:>8}{f'streaming/{n_jobs}':>14}{seconds:>10.3f}{peak / 2 ** 20:>11.1f}  {stages}")
+
+
+if __name__ == "__main__":
+    main()
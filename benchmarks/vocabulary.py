@@ -0,0 +1,65 @@
+import argparse
+import json
+import pickle
+import time
+from typing import List
+
+from benchmarks.harness import REPO_ROOT
+from emails.training import HEADS
+
+
+def evaluate(preset: str, training_file: str, data: List[dict], folds: int, emails: int, seed: int) -> dict:
+    from sklearn.naive_bayes import MultinomialNB
+    from emails.analysis import MailAnalyzer
+    from emails.preprocessing import build_vectorizer
+    from emails.training import cross_validate
+
+    def build():
+        return build_vectorizer(preset), {head: MultinomialNB() for head in HEADS}
+
+    accuracy = cross_validate(training_file, build, folds, seed)
+
+    analyzer = MailAnalyzer(training_file, preprocessing=preset)
+    texts = [data[i % len(data)]["body"] + f" #{i}" for i in range(emails)]
+    start = time.perf_counter()
+    analyzer.predict_detailed_batch(texts)
+    batch_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for text in texts[:200]:
+        analyzer.predict_detailed(text)
+    single_seconds = time.perf_counter() - start
+
+    return {
+        "preset": preset,
+        "vocabulary": len(analyzer.vectorizer.vocabulary_),
+        "model_bytes": len(pickle.dumps(analyzer)),
+        "batch_throughput": len(texts) / batch_seconds,
+        "single_throughput": min(200, len(texts)) / single_seconds,
+        "category_accuracy": accuracy["category"],
+        "mean_accuracy": sum(accuracy.values()) / len(accuracy),
+    }
+
+
+def main():
+    from emails.preprocessing import PRESETS
+
+    parser = argparse.ArgumentParser(description="Compare MailAnalyzer preprocessing presets.")
+    parser.add_argument("presets", nargs="*", default=list(PRESETS), help="Presets to compare (default: all).")
+    parser.add_argument("--training-file", default=str(REPO_ROOT / "training_data.json"))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--emails", type=int, default=2000, help="Emails used for the throughput measurement.")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with open(args.training_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    print(f"{'preset':<14}{'vocab':>8}{'model KB':>10}{'batch/s':>11}{'single/s':>10}{'category':>10}{'mean acc':>10}")
+    for preset in args.presets:
+        r = evaluate(preset, args.training_file, data, args.folds, args.emails, args.seed)
+        print(f"{r['preset']:<14}{r['vocabulary']:>8}{r['model_bytes'] / 1024:>10.1f}{r['batch_throughput']:>11,.0f}"
+              f"{r['single_throughput']:>10,.0f}{r['category_accuracy']:>10.1%}{r['mean_accuracy']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import asyncio
+import math
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.metrics import registry
+
+ADMISSION_DECISIONS = registry.counter(
+    "mailer_admission_requests_total",
+    "Inference requests by admission outcome: admitted, queued, throttled (429) or shed (503).", ("result",))
+ADMISSION_EMAILS = registry.counter(
+    "mailer_admission_emails_total", "Emails admitted for classification.")
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "mailer_admission_in_flight", "Inference requests currently holding a concurrency slot.")
+ADMISSION_QUEUED = registry.gauge(
+    "mailer_admission_queued", "Inference requests waiting for a concurrency slot.")
+ADMISSION_WAIT = registry.histogram(
+    "mailer_admission_queue_wait_seconds", "Time inference requests waited for a concurrency slot.")
+
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to capacity; one token is one email to classify"""
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float, now: Optional[float] = None) -> float:
+        """Takes cost tokens and returns 0, or takes nothing and returns the seconds until it could"""
+        self._refill(time.monotonic() if now is None else now)
+        # A request bigger than the whole burst goes through once the bucket is full and leaves it in debt,
+        # so it is charged in full instead of being refused forever.
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def refund(self, cost: float):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class AdmissionController:
+    """Per-user token buckets in front of a global concurrency cap with a short, bounded wait queue
+
+    Over-quota users get 429 right away. When every slot is busy a request waits in the queue; when the queue
+    is full or the wait times out it gets 503. Both carry Retry-After.
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrent: int, max_queued: int, queue_timeout: float,
+                 max_tenants: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_tenants = max_tenants
+        self.in_flight = 0
+        self.queued = 0
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        # Moving average of how long a slot is held, for the Retry-After of shed requests.
+        self._hold_seconds = 1.0
+        ADMISSION_IN_FLIGHT.set_function(lambda: self.in_flight)
+        ADMISSION_QUEUED.set_function(lambda: self.queued)
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tenants:
+                # A full bucket carries no state worth keeping.
+                now = time.monotonic()
+                for key in [k for k, b in self._buckets.items() if b.is_full(now)]:
+                    del self._buckets[key]
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _shed(self, reason: str):
+        ADMISSION_DECISIONS.inc(result="shed")
+        wait = self._hold_seconds * (self.queued + 1) / self.max_concurrent
+        raise HTTPException(status_code=503, detail=reason, headers=_retry_after(wait))
+
+    async def _acquire_slot(self):
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self.queued >= self.max_queued:
+            self._shed("Server is busy, try again later")
+        self.queued += 1
+        ADMISSION_DECISIONS.inc(result="queued")
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._shed("Timed out waiting for capacity")
+        finally:
+            self.queued -= 1
+        ADMISSION_WAIT.observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: int) -> AsyncIterator[None]:
+        """Holds a concurrency slot for the body of the block and charges cost emails to the user's bucket"""
+        cost = max(cost, 1)
+        bucket = self._bucket(user_id)
+        wait = bucket.take(cost)
+        if wait:
+            ADMISSION_DECISIONS.inc(result="throttled")
+            raise HTTPException(status_code=429, detail="Analysis quota exceeded", headers=_retry_after(wait))
+        try:
+            await self._acquire_slot()
+        except HTTPException:
+            bucket.refund(cost)
+            raise
+        ADMISSION_DECISIONS.inc(result="admitted")
+        ADMISSION_EMAILS.inc(cost)
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.perf_counter() - start)
+            self._slots.release()
+
+
+class _Unlimited:
+    @asynccontextmanager
+    async def admit(self, user_id: int, cost: int) -> AsyncIterator[None]:
+        yield
+
+
+_controller = None
+
+
+def get_admission():
+    global _controller
+    if _controller is None:
+        if settings.ADMISSION_ENABLED:
+            _controller = AdmissionController(
+                settings.ADMISSION_EMAILS_PER_SECOND, settings.ADMISSION_BURST, settings.ADMISSION_MAX_CONCURRENT,
+                settings.ADMISSION_MAX_QUEUED, settings.ADMISSION_QUEUE_TIMEOUT)
+        else:
+            _controller = _Unlimited()
+    return _controller
+
+
+@contextmanager
+def admission_disabled() -> Iterator[None]:
+    """Admits every request inside the block, e.g. for benchmarks that would exhaust a user's quota"""
+    global _controller
+    previous, _controller = _controller, _Unlimited()
+    try:
+        yield
+    finally:
+        _controller = previous
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +8,42 @@ class Settings(BaseSettings):
     ALGORITHM: str
     FERNET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    METRICS_ENABLED: bool = True
+    ANALYZER_PREPROCESSING: str = "default"
+    ANALYZER_TRAINING_JOBS: int = 1
+    SEARCH_TEXT_CONFIG: str = "simple"
+    DEDUP_ENABLED: bool = True
+    DEDUP_SIMILARITY: float = 0.6
+    DEDUP_MAX_CLUSTERS_PER_USER: int = 10000
+    BODY_COMPRESSION: str = "zlib"
+    BODY_COMPRESSION_LEVEL: Optional[int] = None
+    BODY_MAX_BYTES: int = 1024 * 1024
+    RETENTION_ENABLED: bool = False
+    RETENTION_HOT_DAYS: int = 180
+    RETENTION_ARCHIVE_DAYS: int = 0
+    RETENTION_BATCH_SIZE: int = 500
+    RETENTION_BATCH_PAUSE: float = 0.1
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    PIPELINE_EXECUTOR: str = "process"
+    PIPELINE_WORKERS: int = 0
+    PIPELINE_QUEUE_SIZE: int = 256
+    PIPELINE_FETCH_BATCH: int = 50
+    PIPELINE_PARSE_CONCURRENCY: int = 0
+    PIPELINE_CLASSIFY_CONCURRENCY: int = 0
+    PIPELINE_CLASSIFY_BATCH: int = 32
+    PIPELINE_PERSIST_CONCURRENCY: int = 1
+    PIPELINE_PERSIST_BATCH: int = 100
+    PIPELINE_PERSIST_WAIT: float = 0.2
+    PUSH_BUFFER_SIZE: int = 100
+    PUSH_SLOW_CONSUMER_POLICY: str = "disconnect"
+    PUSH_HEARTBEAT_SECONDS: float = 15.0
+    PUSH_REPLAY_PAGE: int = 200
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_EMAILS_PER_SECOND: float = 200.0
+    ADMISSION_BURST: int = 2000
+    ADMISSION_MAX_CONCURRENT: int = 0
+    ADMISSION_MAX_QUEUED: int = 32
+    ADMISSION_QUEUE_TIMEOUT: float = 5.0
 
     class Config:
         env_file = ".env"
@@ -1,3 +1,5 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from core.config import settings
@@ -9,3 +11,18 @@ async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False
 async def get_db():
     async with async_session() as session:
         yield session
+
+def add_missing_columns(sync_conn, table):
+    """create_all() does not alter existing tables; add new nullable columns in place"""
+    existing = {c["name"] for c in inspect(sync_conn).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+
+def add_missing_indexes(sync_conn, table):
+    """Same as add_missing_columns for indexes declared after the table was created"""
+    existing = {i["name"] for i in inspect(sync_conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(sync_conn)
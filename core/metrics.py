@@ -0,0 +1,222 @@
+import threading
+from abc import ABC, abstractmethod
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_key", "_start")
+
+    def __init__(self, histogram: "Histogram", key: Tuple[str, ...]):
+        self._histogram = histogram
+        self._key = key
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram._observe(self._key, time.perf_counter() - self._start)
+        return False
+
+
+class _Metric(ABC):
+    type_name = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def render(self) -> str:
+        ...
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        with self._lock:
+            items = list(self._values.items())
+        return "\n".join(f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Reads the value from function at render time, e.g. a queue's qsize"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = function
+
+    def render(self) -> str:
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            items[key] = function()
+        return "\n".join(f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items.items())
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        self._observe(self._key(labels), value)
+
+    def time(self, **labels):
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, self._key(labels))
+
+    def render(self) -> str:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} is already registered as a {existing.type_name} "
+                                 f"with labels {existing.labelnames}")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        blocks = []
+        for metric in self._metrics.values():
+            body = metric.render()
+            blocks.append(f"# HELP {metric.name} {metric.documentation}\n# TYPE {metric.name} {metric.type_name}")
+            if body:
+                blocks.append(body)
+        return "\n".join(blocks) + "\n"
+
+
+registry = MetricsRegistry()
+
+IMAP_DURATION = registry.histogram(
+    "mailer_imap_duration_seconds", "Time spent in IMAP operations.", ("stage", "user_id"))
+MIME_PARSE_DURATION = registry.histogram(
+    "mailer_mime_parse_duration_seconds", "Time spent parsing a raw RFC822 message.", ("user_id",))
+EMAILS_FETCHED = registry.counter(
+    "mailer_emails_fetched_total", "Emails fetched from IMAP servers.", ("user_id",))
+POLL_CYCLE_DURATION = registry.histogram(
+    "mailer_poll_cycle_duration_seconds", "Duration of one EmailPoller polling cycle.", ("user_id",))
+POLL_ERRORS = registry.counter(
+    "mailer_poll_errors_total", "Failed EmailPoller polling cycles.", ("user_id",))
+ANALYSIS_DURATION = registry.histogram(
+    "mailer_analysis_duration_seconds", "Time spent in MailAnalyzer stages.", ("stage",))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "mailer_http_request_duration_seconds", "HTTP request latency per endpoint.", ("method", "endpoint", "status"))
+HTTP_SERIALIZE_DURATION = registry.histogram(
+    "mailer_http_serialize_duration_seconds", "Time spent rendering JSON response bodies.")
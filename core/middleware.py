@@ -0,0 +1,87 @@
+import asyncio
+import time
+from auth.models import User
+from auth.services import decode_token
+from core.database import async_session
+from core.metrics import registry as metrics_registry, HTTP_REQUEST_DURATION
+from core.profiler import SamplingProfiler, current_request_profiler, profiles
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics_registry.enabled:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                endpoint=route.path if route else "unmatched",
+                status=status_code,
+            )
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _is_superuser(scope) -> bool:
+    authorization = _header(scope, b"authorization")
+    if not authorization or not authorization.startswith("Bearer "):
+        return False
+    payload = decode_token(authorization.split(" ", 1)[1])
+    try:
+        user_id = int(payload.get("sub"))
+    except (TypeError, ValueError):
+        return False
+    async with async_session() as session:
+        user = await session.get(User, user_id)
+    return bool(user and user.is_superuser)
+
+
+class ProfilingMiddleware:
+    """Profiles a single request when an admin sends ``X-Profile: 1``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _header(scope, b"x-profile") not in ("1", "true"):
+            return await self.app(scope, receive, send)
+        if not await _is_superuser(scope):
+            return await self.app(scope, receive, send)
+
+        profile_id = profiles.new_id()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        profiler = SamplingProfiler(task=asyncio.current_task())
+        profiler.start()
+        token = current_request_profiler.set(profiler)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request_profiler.reset(token)
+            profiler.stop()
+            profiles.put(profile_id, profiler.collapsed())
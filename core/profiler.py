@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+DEFAULT_INTERVAL = 0.005
+MAX_STORED_PROFILES = 32
+
+
+def _frame_label(code) -> str:
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:]
+    return f"{code.co_name} ({'/'.join(parts)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples every thread's stack; with ``task`` set, keeps only samples taken while it runs
+
+    Work the task hands to worker threads through ``attributed`` functions is sampled along with it.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, task: Optional[asyncio.Task] = None):
+        self.interval = interval
+        self.task = task
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop_thread_id = None
+        self._task_frame = None
+        self._worker_threads = set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        try:
+            asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+        except RuntimeError:
+            self._loop_thread_id = None
+        # asyncio's task bookkeeping may only be read on the loop, so the task is recorded here by its root
+        # coroutine frame and the sampler thread looks for that frame on the loop thread's stack.
+        if self.task is not None:
+            self._task_frame = self.task.get_coro().cr_frame
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    @contextmanager
+    def worker_thread(self) -> Iterator[None]:
+        """Samples the calling thread as part of the task for the duration of the block"""
+        thread_id = threading.get_ident()
+        self._worker_threads.add(thread_id)
+        try:
+            yield
+        finally:
+            self._worker_threads.discard(thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            on_loop = thread_id == self._loop_thread_id
+            worker = thread_id in self._worker_threads
+            if self.task is not None and not (on_loop or worker):
+                continue
+            stack, root = [], None
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                if frame.f_code.co_flags & inspect.CO_COROUTINE:
+                    # The outermost coroutine frame belongs to the task the loop is stepping.
+                    root = frame
+                frame = frame.f_back
+            if self.task is not None and on_loop and (root is None or root is not self._task_frame):
+                continue
+            stack.append(names.get(thread_id, str(thread_id)).replace(";", ":"))
+            if on_loop and root is not None:
+                stack.insert(-1, f"task:{root.f_code.co_name}".replace(";", ":"))
+            stack.reverse()
+            self._counts[";".join(stack)] += 1
+        self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self._counts.most_common())
+
+
+class ProfileStore:
+    def __init__(self, max_items: int = MAX_STORED_PROFILES):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def put(self, profile_id: str, data: str):
+        self._items[profile_id] = data
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._items.get(profile_id)
+
+
+profiles = ProfileStore()
+current_request_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar("current_request_profiler", default=None)
+_process_profiler: Optional[SamplingProfiler] = None
+
+
+def attributed(fn: Callable) -> Callable:
+    """Wraps fn so that, run on a worker thread for a profiled request, the thread shows up in its profile
+
+    The request's context, and with it current_request_profiler, is copied into run_in_threadpool calls.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        profiler = current_request_profiler.get()
+        if profiler is None:
+            return fn(*args, **kwargs)
+        with profiler.worker_thread():
+            return fn(*args, **kwargs)
+    return run
+
+
+async def profile_process(seconds: float, interval: float = DEFAULT_INTERVAL) -> SamplingProfiler:
+    global _process_profiler
+    if _process_profiler is not None and _process_profiler.running:
+        raise RuntimeError("A process profile is already running")
+    profiler = SamplingProfiler(interval=interval)
+    _process_profiler = profiler
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        _process_profiler = None
+    return profiler
+
+
+def profile_filename(prefix: str, started_at: float) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(started_at))
+    return f"{prefix}-{stamp}-{os.getpid()}.collapsed"
@@ -0,0 +1,50 @@
+import math
+from fastapi.responses import JSONResponse
+from core.metrics import HTTP_SERIALIZE_DURATION
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_LEAVES = (str, int, bool, type(None))
+
+
+def _check_finite(content):
+    # orjson writes NaN and infinities as null; refuse them like json.dumps(allow_nan=False) does.
+    stack = [content]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind in _LEAVES:
+            continue
+        if kind is dict:
+            stack.extend(value.values())
+        elif kind is list or kind is tuple:
+            stack.extend(value)
+        elif isinstance(value, float):
+            if not math.isfinite(value):
+                raise ValueError("Out of range float values are not JSON compliant")
+        elif np is not None and isinstance(value, (np.ndarray, np.floating)):
+            if np.issubdtype(value.dtype, np.floating) and not np.isfinite(value).all():
+                raise ValueError("Out of range float values are not JSON compliant")
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed; the output is the same compact UTF-8 JSON"""
+
+    def render(self, content) -> bytes:
+        with HTTP_SERIALIZE_DURATION.time():
+            if orjson is not None:
+                _check_finite(content)
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+            return super().render(content)
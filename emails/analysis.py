@@ -1,14 +1,68 @@
-import json
-from sklearn.feature_extraction.text import TfidfVectorizer
+from collections.abc import Mapping
 from sklearn.naive_bayes import MultinomialNB
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Union
 import numpy as np
+from core.metrics import ANALYSIS_DURATION
+from emails.preprocessing import PreprocessingConfig, build_vectorizer
+from emails.training import HEADS, fit_streaming
+
+
+ANALYSIS_FIELDS = HEADS + ("action_required", "response_template", "confidence_score")
+
+
+class LazyAnalysis(Mapping):
+    """A predict_detailed result that evaluates heads only when they are read
+
+    Reading a single head predicts just that head; iterating, dict() or any other field computes the whole
+    analysis once, after which the text is released. Values are deterministic, so concurrent readers at most
+    repeat some work.
+    """
+
+    def __init__(self, analyzer: "MailAnalyzer", text: str):
+        self._analyzer = analyzer
+        self._text: Optional[str] = text
+        self._values: Dict[str, Any] = {}
+
+    @property
+    def complete(self) -> bool:
+        return self._text is None
+
+    def knows(self, key: str) -> bool:
+        return key in self._values
+
+    def _fill(self, values: Dict[str, Any], complete: bool = False):
+        if complete:
+            self._values = values
+            self._text = None
+        elif self._text is not None:
+            self._values.update(values)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._values:
+            return self._values[key]
+        if key not in ANALYSIS_FIELDS:
+            raise KeyError(key)
+        if key in HEADS and self._text is not None:
+            self._analyzer.predict_heads([self], [key])
+        else:
+            self._analyzer.complete([self])
+        return self._values[key]
+
+    def __iter__(self):
+        if self._text is not None:
+            self._analyzer.complete([self])
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(ANALYSIS_FIELDS)
 
 
 class MailAnalyzer:
-    def __init__(self, training_file: str):
-        self.vectorizer = TfidfVectorizer()
+    def __init__(self, training_file: str, preprocessing: Union[str, PreprocessingConfig, None] = None,
+                 n_jobs: int = 1):
+        self.n_jobs = n_jobs
+        self.vectorizer = build_vectorizer(preprocessing)
         self.category_clf = MultinomialNB()
         self.subcategory_clf = MultinomialNB()
         self.priority_clf = MultinomialNB()
@@ -17,56 +71,42 @@ class MailAnalyzer:
         self.department_clf = MultinomialNB()
         self._train(training_file)
 
+    def heads(self) -> Dict[str, MultinomialNB]:
+        return {name: getattr(self, f"{name}_clf") for name in HEADS}
+
     def _train(self, training_file: str):
         training_path = Path(training_file)
         if not training_path.exists():
             raise FileNotFoundError(f"{training_file} bulunamadı.")
 
-        with open(training_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        texts = [x["body"] for x in data]
-        categories = [x["category"] for x in data]
-        subcategories = [x["subcategory"] for x in data]
-        priorities = [x["priority"] for x in data]
-        sentiments = [x["sentiment"] for x in data]
-        urgencies = [x["urgency"] for x in data]
-        departments = [x["department"] for x in data]
-        actions_required = [x["action_required"] for x in data]
-        response_templates = [x["response_template"] for x in data]
-
-        X = self.vectorizer.fit_transform(texts)
-
-        self.category_clf.fit(X, categories)
-        self.subcategory_clf.fit(X, subcategories)
-        self.priority_clf.fit(X, priorities)
-        self.sentiment_clf.fit(X, sentiments)
-        self.urgency_clf.fit(X, urgencies)
-        self.department_clf.fit(X, departments)
-
-        self.actions_required_mapping = {item["subcategory"]: item["action_required"] for item in data}
-        self.response_templates_mapping = {item["subcategory"]: item["response_template"] for item in data}
+        mappings, self.training_report = fit_streaming(self.vectorizer, self.heads(), training_path, self.n_jobs)
+        self.actions_required_mapping = mappings["action_required"]
+        self.response_templates_mapping = mappings["response_template"]
 
     def predict(self, text: str) -> str:
-        X_test = self.vectorizer.transform([text])
-        return self.category_clf.predict(X_test)[0]
+        with ANALYSIS_DURATION.time(stage="vectorize"):
+            X_test = self.vectorizer.transform([text])
+        with ANALYSIS_DURATION.time(stage="classify"):
+            return self.category_clf.predict(X_test)[0]
 
     def predict_detailed(self, text: str) -> Dict[str, Any]:
-        X_test = self.vectorizer.transform([text])
+        with ANALYSIS_DURATION.time(stage="vectorize"):
+            X_test = self.vectorizer.transform([text])
 
-        category = self.category_clf.predict(X_test)[0]
-        subcategory = self.subcategory_clf.predict(X_test)[0]
-        priority = self.priority_clf.predict(X_test)[0]
-        sentiment = self.sentiment_clf.predict(X_test)[0]
-        urgency = self.urgency_clf.predict(X_test)[0]
-        department = self.department_clf.predict(X_test)[0]
+        with ANALYSIS_DURATION.time(stage="classify"):
+            category = str(self.category_clf.predict(X_test)[0])
+            subcategory = str(self.subcategory_clf.predict(X_test)[0])
+            priority = str(self.priority_clf.predict(X_test)[0])
+            sentiment = str(self.sentiment_clf.predict(X_test)[0])
+            urgency = str(self.urgency_clf.predict(X_test)[0])
+            department = str(self.department_clf.predict(X_test)[0])
 
-        action_required = self.actions_required_mapping.get(subcategory, "inceleme")
-        response_template = self.response_templates_mapping.get(subcategory, f"{category}_standard")
+            action_required = self.actions_required_mapping.get(subcategory, "inceleme")
+            response_template = self.response_templates_mapping.get(subcategory, f"{category}_standard")
 
-        category_confidence = np.max(self.category_clf.predict_proba(X_test))
-        subcategory_confidence = np.max(self.subcategory_clf.predict_proba(X_test))
-        overall_confidence = (category_confidence + subcategory_confidence) / 2
+            category_confidence = np.max(self.category_clf.predict_proba(X_test))
+            subcategory_confidence = np.max(self.subcategory_clf.predict_proba(X_test))
+            overall_confidence = (category_confidence + subcategory_confidence) / 2
 
         return {
             "category": category,
@@ -77,9 +117,93 @@ class MailAnalyzer:
             "department": department,
             "action_required": action_required,
             "response_template": response_template,
-            "confidence_score": round(overall_confidence, 4)
+            "confidence_score": float(round(overall_confidence, 4))
         }
 
+    def predict_detailed_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        if not texts:
+            return []
+
+        with ANALYSIS_DURATION.time(stage="vectorize"):
+            X_test = self.vectorizer.transform(texts)
+
+        with ANALYSIS_DURATION.time(stage="classify"):
+            categories = self.category_clf.predict(X_test).tolist()
+            subcategories = self.subcategory_clf.predict(X_test).tolist()
+            priorities = self.priority_clf.predict(X_test).tolist()
+            sentiments = self.sentiment_clf.predict(X_test).tolist()
+            urgencies = self.urgency_clf.predict(X_test).tolist()
+            departments = self.department_clf.predict(X_test).tolist()
+
+            category_confidence = self.category_clf.predict_proba(X_test).max(axis=1)
+            subcategory_confidence = self.subcategory_clf.predict_proba(X_test).max(axis=1)
+            overall_confidence = ((category_confidence + subcategory_confidence) / 2).round(4).tolist()
+
+        results = []
+        for i in range(len(texts)):
+            category = categories[i]
+            subcategory = subcategories[i]
+            results.append({
+                "category": category,
+                "subcategory": subcategory,
+                "priority": priorities[i],
+                "sentiment": sentiments[i],
+                "urgency": urgencies[i],
+                "department": departments[i],
+                "action_required": self.actions_required_mapping.get(subcategory, "inceleme"),
+                "response_template": self.response_templates_mapping.get(subcategory, f"{category}_standard"),
+                "confidence_score": overall_confidence[i]
+            })
+        return results
+
+    def lazy(self, texts: List[str]) -> List[LazyAnalysis]:
+        return [LazyAnalysis(self, text) for text in texts]
+
+    def predict_heads(self, analyses: Iterable[Any], heads: Iterable[str]):
+        """Evaluates only the given heads, in one batch, for the analyses that do not know them yet"""
+        heads = list(heads)
+        pending = _pending(analyses, lambda a: not all(a.knows(h) for h in heads))
+        if not pending:
+            return
+        with ANALYSIS_DURATION.time(stage="vectorize"):
+            X_test = self.vectorizer.transform([text for _, text in pending])
+        with ANALYSIS_DURATION.time(stage="classify"):
+            predictions = {head: self.heads()[head].predict(X_test).tolist() for head in heads}
+        for i, (analysis, _) in enumerate(pending):
+            analysis._fill({head: predictions[head][i] for head in heads})
+
+    def complete(self, analyses: Iterable[Any]):
+        """Computes the full analysis, in one batch, for the analyses that are not complete yet"""
+        pending = _pending(analyses, lambda a: True)
+        results = self.predict_detailed_batch([text for _, text in pending])
+        for (analysis, _), values in zip(pending, results):
+            analysis._fill(values, complete=True)
+
+
+def _pending(analyses: Iterable[Any], needed) -> List[tuple]:
+    # Unique incomplete analyses with their text, read once in case another thread completes one meanwhile.
+    # Plain dicts are already complete and are skipped.
+    pending = {}
+    for analysis in analyses:
+        if not isinstance(analysis, LazyAnalysis):
+            continue
+        text = analysis._text
+        if text is not None and id(analysis) not in pending and needed(analysis):
+            pending[id(analysis)] = (analysis, text)
+    return list(pending.values())
+
+
+_default_analyzer = None
+
+
+def get_analyzer() -> MailAnalyzer:
+    global _default_analyzer
+    if _default_analyzer is None:
+        from core.config import settings
+        _default_analyzer = MailAnalyzer("training_data.json", preprocessing=settings.ANALYZER_PREPROCESSING,
+                                         n_jobs=settings.ANALYZER_TRAINING_JOBS)
+    return _default_analyzer
+
 
 if __name__ == "__main__":
     analyzer = MailAnalyzer("training_data.json")
@@ -0,0 +1,73 @@
+import logging
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from core.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("emails.compression")
+
+CODECS = ("none", "zlib", "zstd")
+TRUNCATION_MARKER = "\n\n[truncated: original body was {size} bytes]"
+
+
+def truncate_body(text: str, max_bytes: int) -> Tuple[str, int, bool]:
+    """Caps the UTF-8 size of a body, returning the kept text, the original size and whether it was cut"""
+    data = text.encode("utf-8")
+    size = len(data)
+    if max_bytes <= 0 or size <= max_bytes:
+        return text, size, False
+    # errors="ignore" drops a multi-byte character split by the cut.
+    kept = data[:max_bytes].decode("utf-8", errors="ignore")
+    return kept + TRUNCATION_MARKER.format(size=size), size, True
+
+
+def _resolve_codec(codec: str) -> str:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown body compression codec: {codec}")
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, storing bodies with zlib instead")
+        return "zlib"
+    return codec
+
+
+def compress_body(text: str, codec: str = "zlib", level: Optional[int] = None) -> Tuple[bytes, str]:
+    codec = _resolve_codec(codec)
+    data = text.encode("utf-8")
+    if codec == "zlib":
+        return zlib.compress(data, 6 if level is None else level), codec
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data), codec
+    return data, codec
+
+
+def decompress_body(data: bytes, codec: str) -> str:
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This body was stored with zstd; install zstandard to read it")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec != "none":
+        raise ValueError(f"Unknown body compression codec: {codec}")
+    return data.decode("utf-8")
+
+
+def prepare_body(text: Optional[str], truncate: bool = True) -> Tuple[str, Dict[str, Any]]:
+    """Applies the configured size cap and codec; returns the stored text and the Email column values
+
+    truncate=False skips the cap, for stored bodies that are only being moved.
+    """
+    text, size, truncated = truncate_body(text or "", settings.BODY_MAX_BYTES if truncate else 0)
+    data, codec = compress_body(text, settings.BODY_COMPRESSION, settings.BODY_COMPRESSION_LEVEL)
+    return text, {
+        "body": None,
+        "body_compressed": data,
+        "body_codec": codec,
+        "body_size": size,
+        "body_truncated": truncated,
+    }
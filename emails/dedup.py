@@ -0,0 +1,224 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.metrics import registry
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+SHINGLE_SIZE = 2
+MIN_TOKENS = 8
+_PRIME = (1 << 32) + 15
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_DIGITS = re.compile(r"\d+")
+_rng = np.random.RandomState(20240101)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+DEDUP_LOOKUPS = registry.counter(
+    "mailer_dedup_lookups_total", "Near-duplicate lookups by result.", ("result",))
+
+
+def _tokens(text: str) -> List[str]:
+    # Order numbers, dates and amounts should not make otherwise identical mail look different.
+    return _TOKEN.findall(_DIGITS.sub("0", text.lower()))
+
+
+def minhash(text: str) -> Tuple[np.ndarray, int]:
+    """Returns the MinHash signature of the text's word shingles and the token count"""
+    tokens = _tokens(text)
+    if len(tokens) < SHINGLE_SIZE:
+        shingles = {" ".join(tokens)}
+    else:
+        shingles = {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+    digests = b"".join(hashlib.blake2b(s.encode(), digest_size=4).digest() for s in shingles)
+    hashes = np.frombuffer(digests, dtype=">u4").astype(np.uint64)
+    permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+    return permuted.min(axis=0), len(tokens)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class Cluster:
+    __slots__ = ("cluster_id", "signature", "analysis", "size", "band_keys")
+
+    def __init__(self, signature: np.ndarray, analysis: Dict[str, Any], band_keys: List[Tuple[int, bytes]]):
+        self.cluster_id = hashlib.blake2b(signature.tobytes(), digest_size=8).hexdigest()
+        self.signature = signature
+        self.analysis = analysis
+        self.size = 1
+        self.band_keys = band_keys
+
+
+class NearDuplicateIndex:
+    """MinHash LSH index over one user's mail; candidates from shared bands are verified against the threshold"""
+
+    def __init__(self, threshold: float = 0.6, max_clusters: int = 10000):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.rows = NUM_PERMUTATIONS // LSH_BANDS
+        self._tables: List[Dict[bytes, List[Cluster]]] = [{} for _ in range(LSH_BANDS)]
+        self._clusters: "OrderedDict[str, Cluster]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(LSH_BANDS)]
+
+    def lookup(self, signature: np.ndarray, threshold: Optional[float] = None) -> Optional[Cluster]:
+        threshold = self.threshold if threshold is None else threshold
+        best, best_similarity = None, threshold
+        seen = set()
+        with self._lock:
+            for band, key in self._band_keys(signature):
+                for cluster in self._tables[band].get(key, ()):
+                    if cluster.cluster_id in seen:
+                        continue
+                    seen.add(cluster.cluster_id)
+                    score = similarity(cluster.signature, signature)
+                    if score >= best_similarity:
+                        best, best_similarity = cluster, score
+            if best is not None:
+                best.size += 1
+                self._clusters.move_to_end(best.cluster_id)
+        return best
+
+    def add(self, signature: np.ndarray, analysis: Dict[str, Any]) -> Cluster:
+        cluster = Cluster(signature, analysis, self._band_keys(signature))
+        with self._lock:
+            existing = self._clusters.get(cluster.cluster_id)
+            if existing is not None:
+                return existing
+            self._clusters[cluster.cluster_id] = cluster
+            for band, key in cluster.band_keys:
+                self._tables[band].setdefault(key, []).append(cluster)
+            while len(self._clusters) > self.max_clusters:
+                _, evicted = self._clusters.popitem(last=False)
+                for band, key in evicted.band_keys:
+                    bucket = self._tables[band][key]
+                    bucket.remove(evicted)
+                    if not bucket:
+                        del self._tables[band][key]
+        return cluster
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+
+class DedupRegistry:
+    def __init__(self, threshold: float = 0.6, max_clusters: int = 10000):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self._indexes: Dict[Any, NearDuplicateIndex] = {}
+        self._lock = threading.Lock()
+
+    def for_user(self, user_key) -> NearDuplicateIndex:
+        index = self._indexes.get(user_key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.setdefault(user_key, NearDuplicateIndex(self.threshold, self.max_clusters))
+        return index
+
+
+_registry: Optional[DedupRegistry] = None
+
+
+def get_dedup_registry() -> DedupRegistry:
+    global _registry
+    if _registry is None:
+        from core.config import settings
+        _registry = DedupRegistry(settings.DEDUP_SIMILARITY, settings.DEDUP_MAX_CLUSTERS_PER_USER)
+    return _registry
+
+
+def find_duplicate(user_key, text: str) -> Tuple[Optional[np.ndarray], Optional[Cluster]]:
+    """Returns the text's signature and its cluster, if any; both are None when dedup is disabled"""
+    from core.config import settings
+    if not settings.DEDUP_ENABLED:
+        return None, None
+    signature, token_count = minhash(text or "")
+    # A couple of changed words dominate a very short text, so those only cluster with exact copies.
+    cluster = get_dedup_registry().for_user(user_key).lookup(signature, None if token_count >= MIN_TOKENS else 1.0)
+    DEDUP_LOOKUPS.inc(result="miss" if cluster is None else "hit")
+    return signature, cluster
+
+
+def group_near_duplicates(entries: List[Tuple[Any, str, Optional[np.ndarray]]]) -> List[int]:
+    """For (user_key, text, signature) entries that all missed find_duplicate, the position of the earlier entry
+    each one would have clustered with, or its own position when it starts a cluster
+
+    Lets a batch classify one text per new template, as if its texts had been looked up one after another.
+    """
+    threshold = get_dedup_registry().threshold
+    indexes: Dict[Any, NearDuplicateIndex] = {}
+    leaders = []
+    for position, (user_key, text, signature) in enumerate(entries):
+        leader = position
+        if signature is not None:
+            index = indexes.setdefault(user_key, NearDuplicateIndex(threshold, len(entries)))
+            exact = len(_tokens(text or "")) < MIN_TOKENS
+            cluster = index.lookup(signature, 1.0 if exact else None)
+            if cluster is None:
+                # The batch-local index stores the leader's position where a cluster keeps its analysis.
+                index.add(signature, position)
+            else:
+                leader = cluster.analysis
+        leaders.append(leader)
+    return leaders
+
+
+def remember_analysis(user_key, signature: Optional[np.ndarray],
+                      analysis: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Starts a cluster for a freshly classified text, see find_duplicate"""
+    if signature is None:
+        return dict(analysis), None
+    cluster = get_dedup_registry().for_user(user_key).add(signature, analysis)
+    return dict(cluster.analysis), cluster.cluster_id
+
+
+def analyze_with_dedup(analyzer, user_key, text: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Reuses the analysis of a near-duplicate cluster, classifying only the first member"""
+    signature, cluster = find_duplicate(user_key, text)
+    if cluster is not None:
+        return dict(cluster.analysis), cluster.cluster_id
+    return remember_analysis(user_key, signature, analyzer.predict_detailed(text))
+
+
+def filter_with_dedup(analyzer, user_key, texts: List[str], head: str,
+                      value: str) -> List[Tuple[int, Dict[str, Any], Optional[str]]]:
+    """(index, analysis, cluster_id) of the texts whose head predicts value
+
+    Same results and clusters as analyze_with_dedup on every text, but texts that reuse no cluster only get
+    the one head evaluated, once per near-duplicate group; the full analysis is computed for the matches
+    alone. The registry only holds complete analyses, so only matching texts start clusters.
+    """
+    analyses: List[Any] = [None] * len(texts)
+    cluster_ids: List[Optional[str]] = [None] * len(texts)
+    misses = []
+    for i, text in enumerate(texts):
+        signature, cluster = find_duplicate(user_key, text)
+        if cluster is None:
+            misses.append((i, signature))
+        else:
+            analyses[i], cluster_ids[i] = cluster.analysis, cluster.cluster_id
+
+    leaders = group_near_duplicates([(user_key, texts[i], signature) for i, signature in misses])
+    first = sorted(set(leaders))
+    lazy = dict(zip(first, analyzer.lazy([texts[misses[p][0]] for p in first])))
+    analyzer.predict_heads(lazy.values(), [head])
+    analyzer.complete(analysis for analysis in lazy.values() if analysis[head] == value)
+
+    remembered = {}
+    for p, analysis in lazy.items():
+        if analysis.complete:
+            remembered[p] = remember_analysis(user_key, misses[p][1], dict(analysis))
+    for (i, _), leader in zip(misses, leaders):
+        analyses[i], cluster_ids[i] = remembered.get(leader, (lazy[leader], None))
+
+    matches = [i for i, analysis in enumerate(analyses) if analysis[head] == value]
+    return [(i, dict(analyses[i]), cluster_ids[i]) for i in matches]
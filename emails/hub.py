@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from core.config import settings
+from core.database import async_session
+from core.metrics import registry
+from emails.models import Email
+
+logger = logging.getLogger("emails.hub")
+
+POLICIES = ("disconnect", "drop_oldest")
+EVENT_FIELDS = ("id", "sender", "recipient", "subject", "category", "subcategory", "priority", "sentiment",
+                "urgency", "department", "confidence_score", "cluster_id")
+
+SUBSCRIBERS = registry.gauge("mailer_push_subscribers", "Connected SSE/WebSocket subscribers.")
+PUSH_EVENTS = registry.counter(
+    "mailer_push_events_total", "Push events by outcome: delivered, dropped or disconnected.", ("result",))
+
+
+def email_event(email: Email) -> Dict[str, Any]:
+    event = {name: getattr(email, name) for name in EVENT_FIELDS}
+    event["received_at"] = email.received_at.isoformat() if email.received_at else None
+    return event
+
+
+class Subscription:
+    def __init__(self, user_id: int, buffer_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(buffer_size)
+        self.dropped = 0
+        self.close_reason: Optional[str] = None
+
+
+class PushHub:
+    """In-process fan-out of newly stored mail to each user's subscribers, with a bounded buffer per subscriber"""
+
+    def __init__(self, buffer_size: int = 100, policy: str = "disconnect"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        SUBSCRIBERS.set_function(lambda: sum(len(s) for s in self._subscribers.values()))
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id, self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    def _disconnect(self, subscription: Subscription, reason: str):
+        # The client resumes from its last cursor, so nothing is lost by dropping its buffer.
+        subscription.close_reason = reason
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+        self.unsubscribe(subscription)
+        PUSH_EVENTS.inc(result="disconnected")
+        logger.info("Disconnected a push subscriber of user %s: %s", subscription.user_id, reason)
+
+    def publish(self, user_id: int, event: Dict[str, Any]):
+        for subscription in list(self._subscribers.get(user_id, ())):
+            if subscription.queue.full():
+                if self.policy == "disconnect":
+                    self._disconnect(subscription, "slow consumer")
+                    continue
+                subscription.queue.get_nowait()
+                subscription.dropped += 1
+                PUSH_EVENTS.inc(result="dropped")
+            subscription.queue.put_nowait(event)
+            PUSH_EVENTS.inc(result="delivered")
+
+    async def publish_emails(self, emails: List[Email]):
+        for email in emails:
+            self.publish(email.user_id, email_event(email))
+
+    def subscriber_count(self, user_id: Optional[int] = None) -> int:
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+
+async def emails_after(db: AsyncSession, user_id: int, cursor: int, limit: int) -> List[Email]:
+    result = await db.execute(
+        select(Email).where(Email.user_id == user_id, Email.id > cursor).order_by(Email.id).limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def stream_events(hub: "PushHub", user_id: int, cursor: Optional[int] = None,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Tuple[str, Any]]:
+    """Yields ("email", event), ("dropped", count), ("heartbeat", None) and finally ("closed", reason)
+
+    With a cursor (the id of the last email the client saw) stored mail after it is replayed first. The
+    subscription is opened before the replay and live events the replay already covered are skipped, so
+    nothing falls in between. Batches may commit out of id order, so only the replayed ids are skipped.
+    """
+    heartbeat = heartbeat or settings.PUSH_HEARTBEAT_SECONDS
+    subscription = hub.subscribe(user_id)
+    try:
+        replayed: Set[int] = set()
+        if cursor is not None:
+            last_id = cursor
+            while True:
+                # A session per page, closed before yielding, so a slow client holds no connection.
+                async with async_session() as db:
+                    events = [email_event(row) for row in
+                              await emails_after(db, user_id, last_id, settings.PUSH_REPLAY_PAGE)]
+                for event in events:
+                    replayed.add(event["id"])
+                    yield "email", event
+                if len(events) < settings.PUSH_REPLAY_PAGE:
+                    break
+                last_id = events[-1]["id"]
+        reported_drops = 0
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield "heartbeat", None
+                continue
+            if event is None:
+                yield "closed", subscription.close_reason
+                return
+            if subscription.dropped > reported_drops:
+                yield "dropped", subscription.dropped - reported_drops
+                reported_drops = subscription.dropped
+            if event["id"] in replayed:
+                replayed.discard(event["id"])
+                continue
+            yield "email", event
+    finally:
+        hub.unsubscribe(subscription)
+
+
+_hub: Optional[PushHub] = None
+
+
+def get_hub() -> PushHub:
+    global _hub
+    if _hub is None:
+        _hub = PushHub(settings.PUSH_BUFFER_SIZE, settings.PUSH_SLOW_CONSUMER_POLICY)
+    return _hub
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, LargeBinary
+from sqlalchemy.orm import deferred, relationship
 from auth.models import Base, User
 from datetime import datetime
+from emails.compression import decompress_body
 
 class Email(Base):
     __tablename__ = "emails"
@@ -11,8 +12,75 @@ class Email(Base):
     sender = Column(String, nullable=False)
     recipient = Column(String, nullable=False)
     subject = Column(String, nullable=True)
-    body = Column(String, nullable=True)
-    received_at = Column(DateTime, default=datetime.utcnow)
+    # Legacy plain-text body; new rows keep it NULL and store body_compressed instead.
+    body = deferred(Column(String, nullable=True), raiseload=True)
+    body_compressed = deferred(Column(LargeBinary, nullable=True), raiseload=True)
+    body_codec = Column(String, nullable=True)
+    body_size = Column(Integer, nullable=True)
+    body_truncated = Column(Boolean, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
     is_read = Column(Boolean, default=False)
 
+    category = Column(String, nullable=True)
+    subcategory = Column(String, nullable=True)
+    priority = Column(String, nullable=True)
+    sentiment = Column(String, nullable=True)
+    urgency = Column(String, nullable=True)
+    department = Column(String, nullable=True)
+    confidence_score = Column(Float, nullable=True)
+    cluster_id = Column(String, nullable=True, index=True)
+
     user = relationship("User", backref="emails")
+
+    # AUTOINCREMENT: SQLite would otherwise hand out the ids of archived rows again, and ids must stay
+    # unique across emails and emails_archive and only ever grow for push cursors.
+    __table_args__ = (
+        Index("ix_emails_user_id_received_at", "user_id", "received_at"),
+        {"sqlite_autoincrement": True},
+    )
+
+    @property
+    def body_text(self):
+        """Decompressed body; the query must undefer it, see emails.services.get_user_emails"""
+        if self.body_compressed is not None:
+            return decompress_body(self.body_compressed, self.body_codec)
+        return self.body
+
+
+class ArchivedEmail(Base):
+    """Mail moved out of the hot table by emails.retention; bodies are always compressed here"""
+    __tablename__ = "emails_archive"
+
+    # Postgres requires the partition key in the primary key.
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    received_at = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sender = Column(String, nullable=False)
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body_compressed = deferred(Column(LargeBinary, nullable=True), raiseload=True)
+    body_codec = Column(String, nullable=True)
+    body_size = Column(Integer, nullable=True)
+    body_truncated = Column(Boolean, nullable=True)
+    is_read = Column(Boolean, default=False)
+
+    category = Column(String, nullable=True)
+    subcategory = Column(String, nullable=True)
+    priority = Column(String, nullable=True)
+    sentiment = Column(String, nullable=True)
+    urgency = Column(String, nullable=True)
+    department = Column(String, nullable=True)
+    confidence_score = Column(Float, nullable=True)
+    cluster_id = Column(String, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_emails_archive_user_id_received_at", "user_id", "received_at"),
+        {"postgresql_partition_by": "RANGE (received_at)"},
+    )
+
+    @property
+    def body_text(self):
+        if self.body_compressed is not None:
+            return decompress_body(self.body_compressed, self.body_codec)
+        return None
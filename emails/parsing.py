@@ -0,0 +1,50 @@
+from email import message_from_bytes
+from email.header import decode_header
+from typing import Dict
+
+
+def decode_header_value(h) -> str:
+    if not h:
+        return ""
+    parts = decode_header(h)
+    out = []
+    for val, enc in parts:
+        if isinstance(val, bytes):
+            try:
+                out.append(val.decode(enc or "utf-8", errors="ignore"))
+            except LookupError:
+                out.append(val.decode("utf-8", errors="ignore"))
+        else:
+            out.append(val)
+    return "".join(out)
+
+
+def _decode_payload(part) -> str:
+    payload = part.get_payload(decode=True)
+    if not payload:
+        return ""
+    try:
+        return payload.decode(part.get_content_charset() or "utf-8", errors="ignore")
+    except LookupError:
+        return payload.decode("utf-8", errors="ignore")
+
+
+def extract_body(msg) -> str:
+    if not msg.is_multipart():
+        return _decode_payload(msg)
+    for part in msg.walk():
+        disp = str(part.get("Content-Disposition") or "")
+        if part.get_content_type() == "text/plain" and "attachment" not in disp:
+            return _decode_payload(part)
+    return ""
+
+
+def parse_message(raw: bytes) -> Dict[str, str]:
+    msg = message_from_bytes(raw)
+    return {
+        "subject": decode_header_value(msg.get("Subject")),
+        "sender": msg.get("From") or "",
+        "to": msg.get("To") or "",
+        "date": msg.get("Date") or "",
+        "body": extract_body(msg),
+    }
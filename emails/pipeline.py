@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from core.database import async_session
+from core.metrics import registry
+from emails.analysis import get_analyzer
+from emails.compression import prepare_body
+from emails.dedup import find_duplicate, group_near_duplicates, remember_analysis
+from emails.hub import get_hub
+from emails.models import Email
+from emails.parsing import parse_message
+from emails.search import index_email
+
+logger = logging.getLogger("emails.pipeline")
+
+STAGES = ("parse", "classify", "persist")
+QUEUE_DEPTH = registry.gauge(
+    "mailer_pipeline_queue_depth", "Items waiting in front of each ingest stage.", ("stage",))
+STAGE_ITEMS = registry.counter(
+    "mailer_pipeline_items_total", "Items completed by each ingest stage.", ("stage",))
+STAGE_ERRORS = registry.counter(
+    "mailer_pipeline_errors_total", "Items that failed in each ingest stage.", ("stage",))
+STAGE_DURATION = registry.histogram(
+    "mailer_pipeline_stage_duration_seconds", "Time an ingest stage spends on one item or batch.", ("stage",))
+BLOCKED_SECONDS = registry.counter(
+    "mailer_pipeline_blocked_seconds_total", "Time producers waited on a full ingest queue.", ("stage",))
+
+
+@dataclass
+class IngestItem:
+    user_id: int
+    mailbox: str
+    raw: Optional[bytes] = None
+    parsed: Optional[Dict[str, Any]] = None
+    analysis: Optional[Dict[str, Any]] = None
+    cluster_id: Optional[str] = None
+
+
+def analysis_columns(analysis: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not analysis:
+        return {}
+    columns = {k: str(analysis[k]) for k in ("category", "subcategory", "priority", "sentiment", "urgency", "department")}
+    columns["confidence_score"] = float(analysis["confidence_score"])
+    return columns
+
+
+def build_email(user_id: int, sender: str, recipient: str, subject: str, body: str,
+                analysis: Optional[Dict[str, Any]] = None, cluster_id: Optional[str] = None) -> Tuple[Email, str]:
+    """Returns a new Email row and the body text to index for it"""
+    body, body_columns = prepare_body(body)
+    email = Email(user_id=user_id, sender=sender, recipient=recipient, subject=subject,
+                  cluster_id=cluster_id, **body_columns, **analysis_columns(analysis))
+    return email, body
+
+
+def _init_worker():
+    # Each worker process trains its own analyzer once instead of receiving a pickled model per task.
+    get_analyzer()
+
+
+def _classify_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    return get_analyzer().predict_detailed_batch(texts)
+
+
+class IngestPipeline:
+    """parse -> classify -> persist over bounded queues; a full queue blocks the stage (or fetcher) feeding it"""
+
+    def __init__(self, executor: Optional[Executor] = None, queue_size: Optional[int] = None,
+                 parse_concurrency: Optional[int] = None, classify_concurrency: Optional[int] = None,
+                 classify_batch: Optional[int] = None, persist_concurrency: Optional[int] = None,
+                 persist_batch: Optional[int] = None, persist_wait: Optional[float] = None,
+                 session_factory=async_session):
+        self.workers = settings.PIPELINE_WORKERS or os.cpu_count() or 1
+        self.queue_size = queue_size or settings.PIPELINE_QUEUE_SIZE
+        self.parse_concurrency = parse_concurrency or settings.PIPELINE_PARSE_CONCURRENCY or self.workers
+        self.classify_concurrency = classify_concurrency or settings.PIPELINE_CLASSIFY_CONCURRENCY or self.workers
+        self.classify_batch = classify_batch or settings.PIPELINE_CLASSIFY_BATCH
+        self.persist_concurrency = persist_concurrency or settings.PIPELINE_PERSIST_CONCURRENCY
+        self.persist_batch = persist_batch or settings.PIPELINE_PERSIST_BATCH
+        self.persist_wait = settings.PIPELINE_PERSIST_WAIT if persist_wait is None else persist_wait
+        self.session_factory = session_factory
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.processed = dict.fromkeys(STAGES, 0)
+        self.on_persisted: List[Callable[[List[Email]], Awaitable[None]]] = []
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._tasks: List[asyncio.Task] = []
+
+    def _make_executor(self) -> Executor:
+        if settings.PIPELINE_EXECUTOR == "process":
+            # spawn: forking a process that runs an event loop and other threads is not safe.
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_worker)
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="ingest")
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        if self._executor is None:
+            self._executor = self._make_executor()
+        self.queues = {stage: asyncio.Queue(self.queue_size) for stage in STAGES}
+        for stage, queue in self.queues.items():
+            QUEUE_DEPTH.set_function(queue.qsize, stage=stage)
+        workers = [(self._parse_worker, self.parse_concurrency),
+                   (self._classify_worker, self.classify_concurrency),
+                   (self._persist_worker, self.persist_concurrency)]
+        self._tasks = [asyncio.create_task(worker()) for worker, count in workers for _ in range(count)]
+        logger.info("Ingest pipeline started: %s workers, parse=%s classify=%s persist=%s", self.workers,
+                    self.parse_concurrency, self.classify_concurrency, self.persist_concurrency)
+
+    async def stop(self):
+        """Waits until everything queued is stored, then stops the workers"""
+        for stage in STAGES:
+            await self.queues[stage].join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {stage: {"depth": self.queues[stage].qsize() if self.queues else 0,
+                        "processed": self.processed[stage]} for stage in STAGES}
+
+    async def submit(self, user_id: int, mailbox: str, raw: bytes):
+        """Entry point for fetchers; waits while the parse queue is full"""
+        await self._put("parse", IngestItem(user_id, mailbox, raw=raw))
+
+    async def _put(self, stage: str, item: IngestItem):
+        queue = self.queues[stage]
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        start = time.perf_counter()
+        await queue.put(item)
+        BLOCKED_SECONDS.inc(time.perf_counter() - start, stage=stage)
+
+    async def _take_batch(self, queue: asyncio.Queue, size: int, wait: float) -> List[IngestItem]:
+        items = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while len(items) < size:
+            try:
+                items.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    def _done(self, stage: str, count: int):
+        self.processed[stage] += count
+        STAGE_ITEMS.inc(count, stage=stage)
+
+    async def _parse_worker(self):
+        loop = asyncio.get_running_loop()
+        queue = self.queues["parse"]
+        while True:
+            item = await queue.get()
+            try:
+                with STAGE_DURATION.time(stage="parse"):
+                    item.parsed = await loop.run_in_executor(self._executor, parse_message, item.raw)
+                item.raw = None
+                self._done("parse", 1)
+                await self._put("classify", item)
+            except Exception:
+                STAGE_ERRORS.inc(stage="parse")
+                logger.exception("Dropping a message from %s that failed to parse", item.mailbox)
+            finally:
+                queue.task_done()
+
+    async def _classify(self, items: List[IngestItem]):
+        # Near-duplicate lookups are cheap and stay on the loop; only new templates go to the executor.
+        pending = []
+        for item in items:
+            signature, cluster = find_duplicate(item.user_id, item.parsed["body"])
+            if cluster is None:
+                pending.append((item, signature))
+            else:
+                item.analysis, item.cluster_id = dict(cluster.analysis), cluster.cluster_id
+        if not pending:
+            return
+        # A burst of templated mail misses the lookup together; classify one text per template in it.
+        leaders = group_near_duplicates([(i.user_id, i.parsed["body"], signature) for i, signature in pending])
+        first = sorted(set(leaders))
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, _classify_batch,
+                                             [pending[p][0].parsed["body"] for p in first])
+        remembered = {p: remember_analysis(pending[p][0].user_id, pending[p][1], analysis)
+                      for p, analysis in zip(first, results)}
+        for (item, _), leader in zip(pending, leaders):
+            analysis, item.cluster_id = remembered[leader]
+            item.analysis = dict(analysis)
+
+    async def _classify_worker(self):
+        queue = self.queues["classify"]
+        while True:
+            items = await self._take_batch(queue, self.classify_batch, 0)
+            try:
+                with STAGE_DURATION.time(stage="classify"):
+                    await self._classify(items)
+                self._done("classify", len(items))
+            except Exception:
+                # Unlabelled mail is still worth storing.
+                STAGE_ERRORS.inc(len(items), stage="classify")
+                logger.exception("Classification failed for %s messages", len(items))
+            try:
+                for item in items:
+                    await self._put("persist", item)
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+    async def _persist(self, items: List[IngestItem]) -> List[Email]:
+        async with self.session_factory() as db:
+            rows = [build_email(item.user_id, item.parsed["sender"], item.parsed["to"], item.parsed["subject"],
+                                item.parsed["body"], item.analysis, item.cluster_id) for item in items]
+            db.add_all([email for email, _ in rows])
+            await db.flush()
+            for email, body in rows:
+                await index_email(db, email.id, email.user_id, email.subject, body)
+            await db.commit()
+        return [email for email, _ in rows]
+
+    async def _persist_worker(self):
+        queue = self.queues["persist"]
+        while True:
+            items = await self._take_batch(queue, self.persist_batch, self.persist_wait)
+            try:
+                stored = []
+                with STAGE_DURATION.time(stage="persist"):
+                    try:
+                        stored = await self._persist(items)
+                    except Exception:
+                        if len(items) == 1:
+                            raise
+                        # Retry one by one so a single bad row does not lose the whole batch.
+                        logger.exception("Batch insert of %s emails failed, retrying individually", len(items))
+                        for item in items:
+                            try:
+                                stored += await self._persist([item])
+                            except Exception:
+                                STAGE_ERRORS.inc(stage="persist")
+                                logger.exception("Dropping an email for user %s that failed to store", item.user_id)
+                self._done("persist", len(stored))
+                for callback in self.on_persisted:
+                    await callback(stored)
+            except Exception:
+                STAGE_ERRORS.inc(len(items), stage="persist")
+                logger.exception("Failed to store %s emails", len(items))
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+
+_pipeline: Optional[IngestPipeline] = None
+
+
+async def get_pipeline() -> IngestPipeline:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = IngestPipeline()
+        _pipeline.on_persisted.append(get_hub().publish_emails)
+    await _pipeline.start()
+    return _pipeline
+
+
+async def shutdown_pipeline():
+    if _pipeline is not None and _pipeline.running:
+        await _pipeline.stop()
@@ -1,10 +1,14 @@
 import asyncio
 from emails.services import fetch_emails
+from core.metrics import POLL_CYCLE_DURATION, POLL_ERRORS
 
 class EmailPoller:
-    def __init__(self, server: str, email_user: str, email_pass: str, interval: int = 60):
+    def __init__(self, server: str, email_user: str, email_pass: str, interval: int = 60, port: int = 993,
+                 user_id: int = 0):
         self.server = server
+        self.port = port
         self.email_user = email_user
+        self.user_id = user_id
         self.email_pass = email_pass
         self.interval = interval
         self.emails = []
@@ -15,12 +19,14 @@ class EmailPoller:
     async def _poll(self):
         while self._running:
             try:
-                new_emails = await fetch_emails(self.server, self.email_user, self.email_pass)
-                for email in new_emails:
-                    if email not in self.emails:
-                        self.emails.append(email)
+                with POLL_CYCLE_DURATION.time(user_id=self.user_id):
+                    new_emails = await fetch_emails(self.server, self.email_user, self.email_pass, self.port, self.user_id)
+                    for email in new_emails:
+                        if email not in self.emails:
+                            self.emails.append(email)
                 print(f"{len(new_emails)} mail çekildi. Toplam: {len(self.emails)}")
             except Exception as e:
+                POLL_ERRORS.inc(user_id=self.user_id)
                 print(f"Polling hatası: {str(e)}")
             await asyncio.sleep(self.interval)
 
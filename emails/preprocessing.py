@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, List, Optional, Union
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+TURKISH_UPPER_TO_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+DIACRITIC_FOLDING = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Used when the NLTK stopwords corpus has not been downloaded.
+FALLBACK_STOP_WORDS = frozenset("""
+acaba ama ancak artık aslında az bana bazı belki ben benden beni benim bile bir biraz birçok birkaç birşey biz bize
+bizden bizi bizim böyle bu buna bunda bundan bunlar bunları bunların bunu bunun burada çok çünkü da daha dahi de
+defa değil diye diğer en gibi hem hep hepsi her hiç için ile ise kez ki kim kimden kime kimi mı mi mu mü nasıl ne
+neden nerde nerede nereye niçin niye o olan olarak oldu olduğu olduğunu olsun onlar onları onların onu onun orada
+sanki şey siz sizden sizi sizin şu şunu tüm ve veya ya yani yine zaten lütfen merhaba teşekkürler
+""".split())
+
+
+def load_stop_words() -> FrozenSet[str]:
+    try:
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words("turkish")) | FALLBACK_STOP_WORDS
+    except (ImportError, LookupError):
+        return FALLBACK_STOP_WORDS
+
+
+@dataclass(frozen=True)
+class PreprocessingConfig:
+    turkish_lowercase: bool = False
+    fold_diacritics: bool = False
+    remove_stop_words: bool = False
+    stem_length: Optional[int] = None
+    min_df: Union[int, float] = 1
+    max_df: Union[int, float] = 1.0
+    max_features: Optional[int] = None
+
+    @property
+    def is_default(self) -> bool:
+        return self == PreprocessingConfig()
+
+
+PRESETS: Dict[str, PreprocessingConfig] = {
+    "default": PreprocessingConfig(),
+    "normalized": PreprocessingConfig(turkish_lowercase=True, fold_diacritics=True),
+}
+PRESETS["compact"] = replace(PRESETS["normalized"], remove_stop_words=True, max_df=0.5)
+PRESETS["compact_stem"] = replace(PRESETS["compact"], stem_length=5)
+PRESETS["tiny"] = replace(PRESETS["compact_stem"], min_df=2, max_features=2000)
+
+
+class TextPreprocessor:
+    def __init__(self, config: PreprocessingConfig):
+        self.config = config
+        stop_words = load_stop_words() if config.remove_stop_words else frozenset()
+        self.stop_words = frozenset(self.normalize(w) for w in stop_words)
+
+    def normalize(self, text: str) -> str:
+        if self.config.turkish_lowercase:
+            text = text.translate(TURKISH_UPPER_TO_LOWER)
+        text = text.lower()
+        if self.config.fold_diacritics:
+            text = text.translate(DIACRITIC_FOLDING)
+        return text
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = TOKEN_PATTERN.findall(text)
+        if self.stop_words:
+            tokens = [t for t in tokens if t not in self.stop_words]
+        if self.config.stem_length:
+            # NLTK ships no Turkish stemmer; prefix truncation is the usual cheap substitute for an agglutinative language.
+            tokens = [t[:self.config.stem_length] for t in tokens]
+        return tokens
+
+
+def resolve_config(preprocessing: Union[str, PreprocessingConfig, None]) -> PreprocessingConfig:
+    if preprocessing is None:
+        return PRESETS["default"]
+    if isinstance(preprocessing, PreprocessingConfig):
+        return preprocessing
+    if preprocessing not in PRESETS:
+        raise ValueError(f"Unknown preprocessing preset: {preprocessing}")
+    return PRESETS[preprocessing]
+
+
+def build_vectorizer(preprocessing: Union[str, PreprocessingConfig, None] = None, cls=TfidfVectorizer):
+    config = resolve_config(preprocessing)
+    if config.is_default:
+        return cls()
+    processor = TextPreprocessor(config)
+    return cls(
+        preprocessor=processor.normalize,
+        tokenizer=processor.tokenize,
+        token_pattern=None,
+        min_df=config.min_df,
+        max_df=config.max_df,
+        max_features=config.max_features,
+    )
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from core.config import settings
+from core.database import engine, add_missing_indexes
+from core.metrics import registry
+from emails.compression import decompress_body, prepare_body
+from emails.models import ArchivedEmail, Email
+from emails.search import unindex_emails
+
+logger = logging.getLogger("emails.retention")
+
+RETENTION_ROWS = registry.counter(
+    "mailer_retention_rows_total", "Rows moved to the archive or purged by the retention job.", ("action",))
+_PARTITION_NAME = re.compile(r"^emails_archive_p(\d{4})(\d{2})$")
+_ARCHIVE_COLUMNS = [c.name for c in ArchivedEmail.__table__.columns if c.name != "archived_at"]
+_lock = asyncio.Lock()
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+async def ensure_archive_storage(conn: AsyncConnection):
+    """Adds hot-table indexes missing from older databases and the archive's catch-all partition on Postgres"""
+    await conn.run_sync(add_missing_indexes, Email.__table__)
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text("CREATE TABLE IF NOT EXISTS emails_archive_default PARTITION OF emails_archive DEFAULT"))
+
+
+async def _ensure_partitions(conn: AsyncConnection, months: Iterable[datetime]):
+    # Monthly partitions are created just before the first row lands in them, so the default one stays empty.
+    for month in sorted(set(months)):
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS emails_archive_p{month:%Y%m} PARTITION OF emails_archive "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        ))
+
+
+async def _reuses_ids(conn: AsyncConnection) -> bool:
+    # SQLite tables created before emails declared AUTOINCREMENT reuse the highest id once its row is deleted.
+    if conn.dialect.name != "sqlite":
+        return False
+    sql = (await conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emails'"))).scalar()
+    return "AUTOINCREMENT" not in (sql or "").upper()
+
+
+async def archive_batch(conn: AsyncConnection, cutoff: datetime, batch_size: int) -> int:
+    """Moves up to batch_size emails received before cutoff into emails_archive
+
+    Legacy plain-text bodies are compressed on the way, in full: BODY_MAX_BYTES applies to new mail only.
+    """
+    table = Email.__table__
+    query = select(table).where(table.c.received_at < cutoff)
+    if await _reuses_ids(conn):
+        # Keeping the newest row in place is enough to stop the id from being handed out again.
+        query = query.where(table.c.id < select(func.max(table.c.id)).scalar_subquery())
+    rows = (await conn.execute(
+        query.order_by(table.c.received_at, table.c.id).limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )).mappings().all()
+    if not rows:
+        return 0
+
+    archived, indexed = [], []
+    for row in rows:
+        values = dict(row)
+        if values["body_compressed"] is None:
+            # Legacy rows were indexed with their full plain-text body.
+            indexed_body = values["body"]
+            values.update(prepare_body(values["body"], truncate=False)[1])
+        else:
+            indexed_body = decompress_body(values["body_compressed"], values["body_codec"])
+        archived.append({name: values[name] for name in _ARCHIVE_COLUMNS})
+        indexed.append({"id": row["id"], "user_id": row["user_id"], "subject": row["subject"], "body": indexed_body})
+
+    if conn.dialect.name == "postgresql":
+        await _ensure_partitions(conn, (_month_start(row["received_at"]) for row in rows))
+    await conn.execute(insert(ArchivedEmail.__table__), archived)
+    await unindex_emails(conn, indexed)
+    await conn.execute(delete(table).where(table.c.id.in_([row["id"] for row in rows])))
+    return len(rows)
+
+
+async def purge_batch(conn: AsyncConnection, cutoff: datetime, batch_size: int) -> int:
+    """Deletes archived emails received before cutoff; on Postgres whole expired partitions are dropped instead"""
+    if conn.dialect.name == "postgresql":
+        names = (await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'emails_archive'::regclass"
+        ))).scalars().all()
+        dropped = 0
+        for name in names:
+            match = _PARTITION_NAME.match(name)
+            if match and _next_month(datetime(int(match[1]), int(match[2]), 1)) <= cutoff:
+                dropped += (await conn.execute(text(f"SELECT count(*) FROM {name}"))).scalar()
+                await conn.execute(text(f"DROP TABLE {name}"))
+        return dropped
+
+    table = ArchivedEmail.__table__
+    ids = (await conn.execute(
+        select(table.c.id).where(table.c.received_at < cutoff).limit(batch_size)
+    )).scalars().all()
+    if ids:
+        await conn.execute(delete(table).where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+async def _run_batches(step, cutoff: datetime, batch_size: int, pause: float) -> int:
+    # Each batch is its own short transaction so writers are never blocked for long.
+    total = 0
+    while True:
+        async with engine.begin() as conn:
+            done = await step(conn, cutoff, batch_size)
+        total += done
+        if done < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def run_retention(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Applies RETENTION_HOT_DAYS and RETENTION_ARCHIVE_DAYS once"""
+    if _lock.locked():
+        raise RuntimeError("Retention is already running")
+    async with _lock:
+        now = now or datetime.utcnow()
+        result = {"archived": 0, "purged": 0}
+        if settings.RETENTION_HOT_DAYS > 0:
+            result["archived"] = await _run_batches(
+                archive_batch, now - timedelta(days=settings.RETENTION_HOT_DAYS),
+                settings.RETENTION_BATCH_SIZE, settings.RETENTION_BATCH_PAUSE)
+            RETENTION_ROWS.inc(result["archived"], action="archived")
+        if settings.RETENTION_ARCHIVE_DAYS > 0:
+            result["purged"] = await _run_batches(
+                purge_batch, now - timedelta(days=settings.RETENTION_ARCHIVE_DAYS),
+                settings.RETENTION_BATCH_SIZE, settings.RETENTION_BATCH_PAUSE)
+            RETENTION_ROWS.inc(result["purged"], action="purged")
+        logger.info("Retention run: %s", result)
+        return result
+
+
+async def retention_loop(interval: Optional[float] = None):
+    interval = interval or settings.RETENTION_INTERVAL_SECONDS
+    while True:
+        try:
+            await run_retention()
+        except RuntimeError as e:
+            logger.info("Skipping retention run: %s", e)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(interval)
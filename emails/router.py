@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Header, HTTPException, Depends
+import json
+from fastapi import APIRouter, Header, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Union
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from auth.services import decode_token
@@ -11,11 +14,16 @@ from core.crypto import decrypt_secret
 import asyncio
 from emails.services import fetch_emails
 from emails.poller import EmailPoller
-from auth.dependencies import get_current_user
+from auth.dependencies import authenticate_token, get_current_user
 
-from emails.analysis import MailAnalyzer
+from core.admission import get_admission
+from core.profiler import attributed
+from emails.analysis import get_analyzer
+from emails.dedup import analyze_with_dedup, filter_with_dedup
+from emails.search import InvalidCursor, SearchUnsupported, search_emails
+from emails.hub import get_hub, stream_events
 
-analyzer = MailAnalyzer('training_data.json')
+analyzer = get_analyzer()
 
 router = APIRouter(prefix="/mail", tags=["emails"])
 pollers = {}
@@ -64,6 +72,47 @@ class AnalyzedEmail(BaseModel):
     date: Optional[str]
     body: Optional[str]
     analysis: AnalysisResult
+    cluster_id: Optional[str] = None
+
+
+class SingleAnalysis(BaseModel):
+    text: str
+    analysis: AnalysisResult
+    cluster_id: Optional[str] = None
+
+
+class AnalysisStats(BaseModel):
+    total_emails: int
+    categories: Dict[str, int]
+    priorities: Dict[str, int]
+    sentiments: Dict[str, int]
+    departments: Dict[str, int]
+    urgencies: Dict[str, int]
+    clusters: int
+
+
+class MatchedEmail(BaseModel):
+    subject: Optional[str]
+    sender: Optional[str]
+    date: Optional[str]
+    analysis: AnalysisResult
+    cluster_id: Optional[str] = None
+
+
+class PriorityEmails(BaseModel):
+    priority: str
+    count: int
+    emails: List[MatchedEmail]
+
+
+class DepartmentEmails(BaseModel):
+    department: str
+    count: int
+    emails: List[MatchedEmail]
+
+
+class PollerStatus(BaseModel):
+    status: str
 
 
 async def verify_token(authorization: str = Header(...)):
@@ -155,10 +204,31 @@ def _fetch_unseen_sync(imap_host: str, imap_port: int, email_addr: str, password
     return out
 
 
+def _analyze_bodies(user_id: int, bodies: List[str]) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    return [analyze_with_dedup(analyzer, user_id, body) for body in bodies]
+
+
+async def _analyze_admitted(user_id: int, bodies: List[str]) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """Classifies off the event loop, charged to the user's quota and under the global concurrency cap"""
+    if not bodies:
+        return []
+    async with get_admission().admit(user_id, len(bodies)):
+        return await run_in_threadpool(attributed(_analyze_bodies), user_id, bodies)
+
+
+async def _filter_admitted(user_id: int, bodies: List[str], head: str,
+                           value: str) -> List[Tuple[int, Dict[str, Any], Optional[str]]]:
+    """Like _analyze_admitted, but evaluates only head for every email and fully analyzes the matches"""
+    if not bodies:
+        return []
+    async with get_admission().admit(user_id, len(bodies)):
+        return await run_in_threadpool(attributed(filter_with_dedup), analyzer, user_id, bodies, head, value)
+
+
 @router.post("/start")
 async def start_polling(config: dict, user=Depends(get_current_user)):
     from emails.poller import EmailPoller
-    poller = EmailPoller(config["server"], config["email"], config["password"], config["interval"])
+    poller = EmailPoller(config["server"], config["email"], config["password"], config["interval"], user_id=user.id)
     poller.start()
     pollers[config["email"]] = poller
     return {"status": "polling started"}
@@ -172,40 +242,41 @@ async def listen_emails(email: str, user=Depends(get_current_user)):
     return poller.get_emails()
 
 
-@router.get("/analyze")
+@router.get("/analyze", response_model=Union[List[AnalyzedEmail], PollerStatus])
 async def analyze_emails(email: str, user=Depends(get_current_user)):
     poller = pollers.get(email)
     if not poller:
         return {"status": "poller not started"}
 
     emails = poller.get_emails()
+    results = await _analyze_admitted(user.id, [mail["body"] for mail in emails])
     analyzed = []
 
-    for mail in emails:
-        analysis_result = analyzer.predict_detailed(mail["body"])
-
+    for mail, (analysis_result, cluster_id) in zip(emails, results):
         analyzed.append({
             "subject": mail.get("subject"),
             "sender": mail.get("sender") or mail.get("from"),
             "to": mail.get("to"),
             "date": mail.get("date"),
             "body": mail.get("body"),
-            "analysis": analysis_result
+            "analysis": analysis_result,
+            "cluster_id": cluster_id
         })
 
     return analyzed
 
 
-@router.get("/analyze-single")
+@router.get("/analyze-single", response_model=SingleAnalysis)
 async def analyze_single_email(text: str, user=Depends(get_current_user)):
-    analysis_result = analyzer.predict_detailed(text)
+    [(analysis_result, cluster_id)] = await _analyze_admitted(user.id, [text])
     return {
         "text": text,
-        "analysis": analysis_result
+        "analysis": analysis_result,
+        "cluster_id": cluster_id
     }
 
 
-@router.get("/stats")
+@router.get("/stats", response_model=Union[AnalysisStats, PollerStatus])
 async def get_analysis_stats(email: str, user=Depends(get_current_user)):
     poller = pollers.get(email)
     if not poller:
@@ -218,11 +289,13 @@ async def get_analysis_stats(email: str, user=Depends(get_current_user)):
         "priorities": {},
         "sentiments": {},
         "departments": {},
-        "urgencies": {}
+        "urgencies": {},
+        "clusters": 0
     }
+    clusters = set()
 
-    for mail in emails:
-        analysis_result = analyzer.predict_detailed(mail["body"])
+    for analysis_result, cluster_id in await _analyze_admitted(user.id, [mail["body"] for mail in emails]):
+        clusters.add(cluster_id)
 
         category = analysis_result["category"]
         priority = analysis_result["priority"]
@@ -236,27 +309,29 @@ async def get_analysis_stats(email: str, user=Depends(get_current_user)):
         stats["departments"][department] = stats["departments"].get(department, 0) + 1
         stats["urgencies"][urgency] = stats["urgencies"].get(urgency, 0) + 1
 
+    stats["clusters"] = len(clusters - {None})
     return stats
 
 
-@router.get("/priority-emails")
+@router.get("/priority-emails", response_model=Union[PriorityEmails, PollerStatus])
 async def get_priority_emails(email: str, priority: str = "yüksek", user=Depends(get_current_user)):
     poller = pollers.get(email)
     if not poller:
         return {"status": "poller not started"}
 
     emails = poller.get_emails()
+    matches = await _filter_admitted(user.id, [mail["body"] for mail in emails], "priority", priority)
     priority_emails = []
 
-    for mail in emails:
-        analysis_result = analyzer.predict_detailed(mail["body"])
-        if analysis_result["priority"] == priority:
-            priority_emails.append({
-                "subject": mail.get("subject"),
-                "sender": mail.get("sender") or mail.get("from"),
-                "date": mail.get("date"),
-                "analysis": analysis_result
-            })
+    for i, analysis_result, cluster_id in matches:
+        mail = emails[i]
+        priority_emails.append({
+            "subject": mail.get("subject"),
+            "sender": mail.get("sender") or mail.get("from"),
+            "date": mail.get("date"),
+            "analysis": analysis_result,
+            "cluster_id": cluster_id
+        })
 
     return {
         "priority": priority,
@@ -265,24 +340,25 @@ async def get_priority_emails(email: str, priority: str = "yüksek", user=Depend
     }
 
 
-@router.get("/department-emails")
+@router.get("/department-emails", response_model=Union[DepartmentEmails, PollerStatus])
 async def get_department_emails(email: str, department: str, user=Depends(get_current_user)):
     poller = pollers.get(email)
     if not poller:
         return {"status": "poller not started"}
 
     emails = poller.get_emails()
+    matches = await _filter_admitted(user.id, [mail["body"] for mail in emails], "department", department)
     department_emails = []
 
-    for mail in emails:
-        analysis_result = analyzer.predict_detailed(mail["body"])
-        if analysis_result["department"] == department:
-            department_emails.append({
-                "subject": mail.get("subject"),
-                "sender": mail.get("sender") or mail.get("from"),
-                "date": mail.get("date"),
-                "analysis": analysis_result
-            })
+    for i, analysis_result, cluster_id in matches:
+        mail = emails[i]
+        department_emails.append({
+            "subject": mail.get("subject"),
+            "sender": mail.get("sender") or mail.get("from"),
+            "date": mail.get("date"),
+            "analysis": analysis_result,
+            "cluster_id": cluster_id
+        })
 
     return {
         "department": department,
@@ -291,6 +367,116 @@ async def get_department_emails(email: str, department: str, user=Depends(get_cu
     }
 
 
+@router.get("/search")
+async def search_stored_emails(
+    q: str,
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    priority: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    urgency: Optional[str] = None,
+    department: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    filters = {
+        "category": category,
+        "subcategory": subcategory,
+        "priority": priority,
+        "sentiment": sentiment,
+        "urgency": urgency,
+        "department": department,
+    }
+    try:
+        items, next_cursor = await search_emails(db, user.id, q, filters, limit=limit, cursor=cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    except SearchUnsupported as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {
+        "query": q,
+        "count": len(items),
+        "items": items,
+        "next_cursor": next_cursor
+    }
+
+
+def _bearer(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization.startswith("Bearer "):
+        return authorization.split(" ", 1)[1]
+    return None
+
+
+def _parse_cursor(value: Optional[str]) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _sse(kind: str, payload) -> str:
+    if kind == "email":
+        return f"id: {payload['id']}\nevent: email\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    if kind == "heartbeat":
+        return ": keep-alive\n\n"
+    if kind == "dropped":
+        return f"event: dropped\ndata: {json.dumps({'count': payload})}\n\n"
+    return f"event: closed\ndata: {json.dumps({'reason': payload})}\n\n"
+
+
+@router.get("/events")
+async def email_events(
+    request: Request,
+    cursor: Optional[str] = None,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    last_event_id: Optional[str] = Header(None),
+):
+    # EventSource cannot set headers, so the token may also come as ?token=.
+    user = await authenticate_token(_bearer(authorization) or token)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    start = _parse_cursor(last_event_id if last_event_id is not None else cursor)
+
+    async def body():
+        async for kind, payload in stream_events(get_hub(), user.id, start):
+            yield _sse(kind, payload)
+
+    return StreamingResponse(body(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.websocket("/ws")
+async def email_websocket(websocket: WebSocket, cursor: Optional[str] = None, token: Optional[str] = None):
+    user = await authenticate_token(_bearer(websocket.headers.get("authorization")) or token)
+    if user is None:
+        await websocket.close(code=1008)
+        return
+    try:
+        start = _parse_cursor(cursor)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        async for kind, payload in stream_events(get_hub(), user.id, start):
+            if kind == "email":
+                await websocket.send_json({"type": "email", "data": payload})
+            elif kind == "heartbeat":
+                await websocket.send_json({"type": "heartbeat"})
+            elif kind == "dropped":
+                await websocket.send_json({"type": "dropped", "count": payload})
+            else:
+                await websocket.send_json({"type": "closed", "reason": payload})
+                await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+
+
 @router.get("/debug-emails")
 async def debug_emails(email: str, user=Depends(get_current_user)):
     poller = pollers.get(email)
@@ -0,0 +1,185 @@
+import base64
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from core.config import settings
+from emails.compression import decompress_body
+
+LABEL_FILTERS = ("category", "subcategory", "priority", "sentiment", "urgency", "department")
+RESULT_COLUMNS = "e.id, e.sender, e.recipient, e.subject, e.received_at, e.is_read, " + \
+    ", ".join(f"e.{label}" for label in LABEL_FILTERS) + ", e.confidence_score, e.cluster_id"
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class SearchUnsupported(RuntimeError):
+    pass
+
+
+def _owner_token(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+async def ensure_search_index(conn: AsyncConnection):
+    """Creates the full-text index for the current dialect and backfills it on first creation"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = (await conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'emails_fts'"))).first()
+        if exists:
+            return
+        # Contentless: only the inverted index is stored, the text itself stays in emails.
+        await conn.execute(text(
+            "CREATE VIRTUAL TABLE emails_fts USING fts5("
+            "owner, subject, body, content='', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        await _backfill(conn, dialect)
+    elif dialect == "postgresql":
+        exists = (await conn.execute(text("SELECT to_regclass('email_search')"))).scalar()
+        if exists:
+            return
+        await conn.execute(text(
+            "CREATE TABLE email_search ("
+            "email_id INTEGER PRIMARY KEY REFERENCES emails(id) ON DELETE CASCADE, "
+            "user_id INTEGER NOT NULL, "
+            "document TSVECTOR NOT NULL)"
+        ))
+        await conn.execute(text("CREATE INDEX ix_email_search_document ON email_search USING GIN (document)"))
+        await conn.execute(text("CREATE INDEX ix_email_search_user_id ON email_search (user_id)"))
+        await _backfill(conn, dialect)
+
+
+_INSERT = {
+    "sqlite": "INSERT INTO emails_fts(rowid, owner, subject, body) VALUES (:id, :owner, :subject, :body)",
+    "postgresql": (
+        "INSERT INTO email_search (email_id, user_id, document) VALUES (:id, :user_id, "
+        "setweight(to_tsvector(CAST(:config AS regconfig), :subject), 'A') || "
+        "setweight(to_tsvector(CAST(:config AS regconfig), :body), 'B'))"
+    ),
+}
+
+
+def _index_params(email_id: int, user_id: int, subject: Optional[str], body: Optional[str]) -> Dict[str, Any]:
+    return {"id": email_id, "user_id": user_id, "owner": _owner_token(user_id), "subject": subject or "",
+            "body": body or "", "config": settings.SEARCH_TEXT_CONFIG}
+
+
+async def _backfill(conn: AsyncConnection, dialect: str, batch_size: int = 500):
+    # Bodies may be compressed, so the text is decoded here rather than indexed with INSERT ... SELECT.
+    last_id = 0
+    while True:
+        rows = (await conn.execute(text(
+            "SELECT id, user_id, subject, body, body_compressed, body_codec FROM emails "
+            "WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": batch_size})).all()
+        if not rows:
+            return
+        params = []
+        for row in rows:
+            body = decompress_body(row.body_compressed, row.body_codec) if row.body_compressed is not None else row.body
+            params.append(_index_params(row.id, row.user_id, row.subject, body))
+        await conn.execute(text(_INSERT[dialect]), params)
+        last_id = rows[-1].id
+
+
+async def index_email(db: AsyncSession, email_id: int, user_id: int, subject: Optional[str], body: Optional[str]):
+    """Adds an email to the full-text index inside the caller's transaction"""
+    dialect = db.get_bind().dialect.name
+    if dialect in _INSERT:
+        await db.execute(text(_INSERT[dialect]), _index_params(email_id, user_id, subject, body))
+
+
+async def unindex_emails(conn, rows: List[Dict[str, Any]]):
+    """Removes emails from the full-text index; rows carry id, user_id, subject and the body as it was indexed"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        # A contentless FTS5 table can only forget a row when given the exact values it indexed.
+        await conn.execute(text(
+            "INSERT INTO emails_fts(emails_fts, rowid, owner, subject, body) "
+            "VALUES ('delete', :id, :owner, :subject, :body)"
+        ), [_index_params(r["id"], r["user_id"], r["subject"], r["body"]) for r in rows])
+    elif dialect == "postgresql":
+        await conn.execute(text("DELETE FROM email_search WHERE email_id = :id"), [{"id": r["id"]} for r in rows])
+
+
+async def reindex_emails(conn, rows: List[Dict[str, Any]], bodies: List[str]):
+    """Replaces the indexed body of emails; rows are as for unindex_emails and bodies holds the new text"""
+    dialect = conn.dialect.name
+    if not rows or dialect not in _INSERT:
+        return
+    await unindex_emails(conn, rows)
+    await conn.execute(text(_INSERT[dialect]), [
+        _index_params(r["id"], r["user_id"], r["subject"], body) for r, body in zip(rows, bodies)])
+
+
+def encode_cursor(rank: float, email_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, email_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, email_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(email_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def _filter_clause(filters: Dict[str, Optional[str]], params: dict) -> str:
+    clauses = []
+    for label in LABEL_FILTERS:
+        value = filters.get(label)
+        if value is not None:
+            clauses.append(f"e.{label} = :{label}")
+            params[label] = value
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+async def search_emails(db: AsyncSession, user_id: int, query: str, filters: Dict[str, Optional[str]] = None,
+                        limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    terms = _TERM.findall(query)
+    if not terms:
+        return [], None
+    dialect = db.get_bind().dialect.name
+    params: Dict[str, Any] = {"user_id": user_id, "limit": limit + 1}
+    label_clause = _filter_clause(filters or {}, params)
+
+    if dialect == "sqlite":
+        # bm25() is lower-is-better; the owner column is matched but carries no weight.
+        params["match"] = f"owner:{_owner_token(user_id)} AND (" + " ".join(f'"{t}"' for t in terms) + ")"
+        inner = (
+            f"SELECT {RESULT_COLUMNS}, bm25(emails_fts, 0.0, 2.0, 1.0) AS rank "
+            "FROM emails_fts JOIN emails e ON e.id = emails_fts.rowid "
+            f"WHERE emails_fts MATCH :match AND e.user_id = :user_id{label_clause}"
+        )
+        after, order = "rank > :rank OR (rank = :rank AND id < :after_id)", "rank ASC, id DESC"
+    elif dialect == "postgresql":
+        params["query"] = " ".join(terms)
+        params["config"] = settings.SEARCH_TEXT_CONFIG
+        inner = (
+            f"SELECT {RESULT_COLUMNS}, ts_rank_cd(s.document, q) AS rank "
+            "FROM email_search s JOIN emails e ON e.id = s.email_id, "
+            "plainto_tsquery(CAST(:config AS regconfig), :query) q "
+            f"WHERE s.user_id = :user_id AND s.document @@ q{label_clause}"
+        )
+        after, order = "rank < :rank OR (rank = :rank AND id < :after_id)", "rank DESC, id DESC"
+    else:
+        raise SearchUnsupported(f"Full-text search is not supported on {dialect}")
+
+    where = ""
+    if cursor:
+        params["rank"], params["after_id"] = decode_cursor(cursor)
+        where = f" WHERE {after}"
+    sql = f"SELECT * FROM ({inner}) ranked{where} ORDER BY {order} LIMIT :limit"
+    rows = [dict(row._mapping) for row in (await db.execute(text(sql), params))]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return rows, next_cursor
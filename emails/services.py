@@ -1,44 +1,44 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from emails.models import Email
+from sqlalchemy.orm import undefer
+from emails.models import ArchivedEmail, Email
 import imaplib
 import email
-from email.header import decode_header
+from emails.parsing import decode_header_value, extract_body
 from core.crypto import decrypt_secret
 from auth.models import User
 import asyncio
+from core.metrics import IMAP_DURATION, MIME_PARSE_DURATION, EMAILS_FETCHED
 
 class MailListener:
-    def __init__(self, imap_server: str, email_address: str, encrypted_password: str):
+    def __init__(self, imap_server: str, email_address: str, encrypted_password: str, user_id: int = 0):
         self.imap_server = imap_server
         self.email_address = email_address
+        self.user_id = user_id
         self.password = decrypt_secret(encrypted_password)
         self.conn = None
 
     def connect(self):
-        self.conn = imaplib.IMAP4_SSL(self.imap_server)
-        self.conn.login(self.email_address, self.password)
-        self.conn.select("INBOX")
+        with IMAP_DURATION.time(stage="connect", user_id=self.user_id):
+            self.conn = imaplib.IMAP4_SSL(self.imap_server)
+            self.conn.login(self.email_address, self.password)
+            self.conn.select("INBOX")
 
     def fetch_unseen(self):
-        status, messages = self.conn.search(None, 'UNSEEN')
+        with IMAP_DURATION.time(stage="search", user_id=self.user_id):
+            status, messages = self.conn.search(None, 'UNSEEN')
         emails = []
         if status == "OK":
             for num in messages[0].split():
-                res, msg_data = self.conn.fetch(num, '(RFC822)')
+                with IMAP_DURATION.time(stage="fetch", user_id=self.user_id):
+                    res, msg_data = self.conn.fetch(num, '(RFC822)')
                 if res != "OK":
                     continue
-                msg = email.message_from_bytes(msg_data[0][1])
-                subject, encoding = decode_header(msg["Subject"])[0]
-                if isinstance(subject, bytes):
-                    subject = subject.decode(encoding or "utf-8")
-                body = ""
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        if part.get_content_type() == "text/plain":
-                            body = part.get_payload(decode=True).decode()
-                else:
-                    body = msg.get_payload(decode=True).decode()
+                EMAILS_FETCHED.inc(user_id=self.user_id)
+                with MIME_PARSE_DURATION.time(user_id=self.user_id):
+                    msg = email.message_from_bytes(msg_data[0][1])
+                    subject = decode_header_value(msg["Subject"])
+                    body = extract_body(msg)
                 emails.append({
                     "subject": subject,
                     "body": body,
@@ -47,43 +47,51 @@ class MailListener:
         return emails
 
 
-async def get_user_emails(db: AsyncSession, user_id: int):
-    result = await db.execute(
-        select(Email)
-        .where(Email.user_id == user_id)
-        .order_by(Email.received_at.desc())
-    )
+async def get_user_emails(db: AsyncSession, user_id: int, include_body: bool = False):
+    query = select(Email).where(Email.user_id == user_id).order_by(Email.received_at.desc())
+    if include_body:
+        query = query.options(undefer(Email.body), undefer(Email.body_compressed))
+    result = await db.execute(query)
     emails = result.scalars().all()
     return emails
 
-async def fetch_emails(server: str, email_user: str, email_pass: str):
+async def get_archived_emails(db: AsyncSession, user_id: int, include_body: bool = False, limit: int = 100):
+    query = (
+        select(ArchivedEmail)
+        .where(ArchivedEmail.user_id == user_id)
+        .order_by(ArchivedEmail.received_at.desc())
+        .limit(limit)
+    )
+    if include_body:
+        query = query.options(undefer(ArchivedEmail.body_compressed))
+    result = await db.execute(query)
+    return result.scalars().all()
+
+async def fetch_emails(server: str, email_user: str, email_pass: str, port: int = 993, user_id: int = 0):
     emails = []
 
     try:
-        imap = imaplib.IMAP4_SSL(server)
-        imap.login(email_user, email_pass)
-        imap.select("INBOX")
+        with IMAP_DURATION.time(stage="connect", user_id=user_id):
+            imap = imaplib.IMAP4_SSL(server, port)
+            imap.login(email_user, email_pass)
+            imap.select("INBOX")
 
-        status, messages = imap.search(None, "ALL")
+        with IMAP_DURATION.time(stage="search", user_id=user_id):
+            status, messages = imap.search(None, "ALL")
         mail_ids = messages[0].split()
 
         for mail_id in mail_ids[-10:]:
-            status, msg_data = imap.fetch(mail_id, "(RFC822)")
+            with IMAP_DURATION.time(stage="fetch", user_id=user_id):
+                status, msg_data = imap.fetch(mail_id, "(RFC822)")
             for response_part in msg_data:
                 if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject, encoding = decode_header(msg["Subject"])[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding if encoding else "utf-8")
-                    from_ = msg.get("From")
-                    date_ = msg.get("Date")
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            content_type = part.get_content_type()
-                            if content_type == "text/plain":
-                                body = part.get_payload(decode=True).decode()
-                    else:
-                        body = msg.get_payload(decode=True).decode()
+                    EMAILS_FETCHED.inc(user_id=user_id)
+                    with MIME_PARSE_DURATION.time(user_id=user_id):
+                        msg = email.message_from_bytes(response_part[1])
+                        subject = decode_header_value(msg["Subject"])
+                        from_ = msg.get("From")
+                        date_ = msg.get("Date")
+                        body = extract_body(msg)
 
                     emails.append({
                         "subject": subject,
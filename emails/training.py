@@ -0,0 +1,256 @@
+import json
+import numbers
+import os
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+
+HEADS = ("category", "subcategory", "priority", "sentiment", "urgency", "department")
+DEFAULT_CHUNK_SIZE = 5000
+_JSON_WHITESPACE = " \t\r\n"
+
+
+@dataclass
+class TrainingReport:
+    documents: int = 0
+    features: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    accuracy: Dict[str, float] = field(default_factory=dict)
+
+    def format(self) -> str:
+        lines = [f"{self.documents:,} documents, {self.features:,} features"]
+        lines += [f"  {stage:<12}{seconds:>9.3f}s" for stage, seconds in self.timings.items()]
+        lines += [f"  {head:<12}{value:>9.1%}" for head, value in self.accuracy.items()]
+        return "\n".join(lines)
+
+
+# --- reading -------------------------------------------------------------------------------------------
+
+def _iter_json_array(f, read_size: int) -> Iterator[Dict[str, Any]]:
+    # raw_decode over a buffer that only ever holds the current object and one read ahead of it.
+    decoder = json.JSONDecoder()
+    buffer, pos, started = "", 0, False
+    while True:
+        while pos < len(buffer) and buffer[pos] in _JSON_WHITESPACE + ("," if started else ""):
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Training file must contain a JSON array or one JSON object per line")
+                started, pos = True, pos + 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+                yield obj
+                continue
+            except json.JSONDecodeError:
+                pass
+        chunk = f.read(read_size)
+        if not chunk:
+            raise ValueError("Training file ended inside its JSON array")
+        buffer, pos = buffer[pos:] + chunk, 0
+
+
+def iter_examples(path, read_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Streams labelled examples from a JSONL file (.jsonl/.ndjson) or a JSON array file"""
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f, read_size)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parallel(tasks: Iterable, n_jobs: int) -> Iterator:
+    """Runs (function, *args) tasks in order, on worker processes only when there is more than one task"""
+    tasks = iter(tasks)
+    head = list(islice(tasks, 2))
+    if n_jobs == 1 or len(head) < 2:
+        return (fn(*args) for fn, *args in chain(head, tasks))
+    return Parallel(n_jobs=n_jobs, return_as="generator")(delayed(fn)(*args) for fn, *args in chain(head, tasks))
+
+
+# --- fitting -------------------------------------------------------------------------------------------
+
+def _count_chunk(vectorizer, texts: List[str]) -> Tuple[List[str], sp.csr_matrix]:
+    """Term counts of one chunk against the chunk's own sorted vocabulary"""
+    counter = CountVectorizer(analyzer=vectorizer.build_analyzer(), dtype=vectorizer.dtype)
+    try:
+        X = counter.fit_transform(texts)
+    except ValueError:
+        # Nothing but stop words in this chunk.
+        return [], sp.csr_matrix((len(texts), 0), dtype=vectorizer.dtype)
+    return counter.get_feature_names_out().tolist(), X
+
+
+def _merge_chunks(chunks: List[Tuple[List[str], sp.csr_matrix]]) -> Tuple[List[str], sp.csr_matrix]:
+    terms = sorted(set().union(*(chunk_terms for chunk_terms, _ in chunks)))
+    index = {term: i for i, term in enumerate(terms)}
+    blocks = []
+    for chunk_terms, X in chunks:
+        columns = np.array([index[t] for t in chunk_terms], dtype=X.indices.dtype)
+        blocks.append(sp.csr_matrix((X.data, columns[X.indices], X.indptr), shape=(X.shape[0], len(terms))))
+    X = sp.vstack(blocks, format="csr")
+    X.sort_indices()
+    return terms, X
+
+
+def _limit_features(vectorizer, terms: List[str], X: sp.csr_matrix) -> Tuple[Dict[str, int], sp.csr_matrix]:
+    # Same min_df/max_df/max_features rules and tie-breaking as CountVectorizer.fit, so the features match.
+    documents = X.shape[0]
+    max_df, min_df = vectorizer.max_df, vectorizer.min_df
+    max_count = max_df if isinstance(max_df, numbers.Integral) else max_df * documents
+    min_count = min_df if isinstance(min_df, numbers.Integral) else min_df * documents
+    if max_count < min_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    dfs = np.bincount(X.indices, minlength=X.shape[1])
+    mask = (dfs <= max_count) & (dfs >= min_count)
+    if vectorizer.max_features is not None and mask.sum() > vectorizer.max_features:
+        tfs = np.asarray(X.sum(axis=0)).ravel()
+        keep = (-tfs[mask]).argsort()[:vectorizer.max_features]
+        limited = np.zeros(len(dfs), dtype=bool)
+        limited[np.where(mask)[0][keep]] = True
+        mask = limited
+    kept = np.where(mask)[0]
+    if len(kept) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    if len(kept) < len(terms):
+        X = X[:, kept]
+    return {terms[i]: new for new, i in enumerate(kept)}, X
+
+
+def fit_streaming(vectorizer, heads: Dict[str, Any], training_file, n_jobs: int = 1,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  include: Optional[Callable[[int], bool]] = None) -> Tuple[Dict[str, Dict[str, str]], TrainingReport]:
+    """Fits an unfitted Count/TfidfVectorizer and the classifier of each head from a streamed training file
+
+    Examples are read and counted chunk by chunk, so only the sparse count matrix and the labels are ever
+    in memory, never all the email bodies. Chunks are counted on n_jobs processes and the heads, which are
+    independent, are fitted on n_jobs threads. include(position) filters examples by their position.
+    Returns the subcategory -> action_required/response_template mappings and a TrainingReport.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    report = TrainingReport()
+    started = time.perf_counter()
+    labels: Dict[str, List[str]] = {name: [] for name in heads}
+    mappings: Dict[str, Dict[str, str]] = {"action_required": {}, "response_template": {}}
+
+    def tasks():
+        examples = (x for position, x in enumerate(iter_examples(training_file))
+                    if include is None or include(position))
+        for chunk in _chunks(examples, chunk_size):
+            for x in chunk:
+                for name in heads:
+                    labels[name].append(x[name])
+                mappings["action_required"][x["subcategory"]] = x["action_required"]
+                mappings["response_template"][x["subcategory"]] = x["response_template"]
+            yield _count_chunk, vectorizer, [x["body"] for x in chunk]
+
+    chunks = list(_parallel(tasks(), n_jobs))
+    if not chunks:
+        raise ValueError(f"{training_file} contains no training examples")
+    report.timings["vectorize"] = time.perf_counter() - started
+
+    start = time.perf_counter()
+    terms, X = _merge_chunks(chunks)
+    del chunks
+    vectorizer.vocabulary_, X = _limit_features(vectorizer, terms, X)
+    vectorizer.fixed_vocabulary_ = False
+    report.documents, report.features = X.shape
+    report.timings["vocabulary"] = time.perf_counter() - start
+
+    if isinstance(vectorizer, TfidfVectorizer):
+        start = time.perf_counter()
+        transformer = TfidfTransformer(norm=vectorizer.norm, use_idf=vectorizer.use_idf,
+                                       smooth_idf=vectorizer.smooth_idf, sublinear_tf=vectorizer.sublinear_tf)
+        X = transformer.fit_transform(X)
+        if vectorizer.use_idf:
+            vectorizer.idf_ = transformer.idf_
+        else:
+            vectorizer._tfidf = transformer
+        report.timings["tfidf"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    Parallel(n_jobs=min(n_jobs, len(heads)), prefer="threads")(
+        delayed(clf.fit)(X, labels[name]) for name, clf in heads.items())
+    report.timings["fit"] = time.perf_counter() - start
+    report.timings["total"] = time.perf_counter() - started
+    return mappings, report
+
+
+# --- evaluation ----------------------------------------------------------------------------------------
+
+def fold_of(position: int, folds: int, seed: int = 0) -> int:
+    """Stable fold assignment that needs neither the corpus size nor a shuffled copy of it"""
+    return zlib.crc32(f"{seed}:{position}".encode()) % folds
+
+
+def cross_validate(training_file, build: Callable[[], Tuple[Any, Dict[str, Any]]], folds: int = 5, seed: int = 0,
+                   n_jobs: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, float]:
+    """Mean k-fold accuracy per head; build() returns a fresh (vectorizer, heads) pair for every fold"""
+    correct, total = Counter(), 0
+    for fold in range(folds):
+        vectorizer, heads = build()
+        fit_streaming(vectorizer, heads, training_file, n_jobs, chunk_size,
+                      include=lambda position: fold_of(position, folds, seed) != fold)
+        held_out = (x for position, x in enumerate(iter_examples(training_file))
+                    if fold_of(position, folds, seed) == fold)
+        for chunk in _chunks(held_out, chunk_size):
+            X = vectorizer.transform([x["body"] for x in chunk])
+            total += len(chunk)
+            for name, clf in heads.items():
+                correct[name] += int(np.sum(clf.predict(X) == np.array([x[name] for x in chunk])))
+    return {name: correct[name] / total for name in heads} if total else {}
+
+
+def main():
+    import argparse
+    from sklearn.naive_bayes import MultinomialNB
+    from emails.preprocessing import build_vectorizer
+
+    parser = argparse.ArgumentParser(description="Train MailAnalyzer heads and report stage timings and k-fold accuracy.")
+    parser.add_argument("training_file", nargs="?", default="training_data.json",
+                        help="JSON array or JSONL file of labelled examples.")
+    parser.add_argument("--preprocessing", default="default", help="Preprocessing preset.")
+    parser.add_argument("--jobs", type=int, default=0, help="Worker processes/threads (default: one per core).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Examples per vectorizing task.")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds, 0 to skip.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def build():
+        return build_vectorizer(args.preprocessing), {name: MultinomialNB() for name in HEADS}
+
+    vectorizer, heads = build()
+    _, report = fit_streaming(vectorizer, heads, args.training_file, args.jobs, args.chunk_size)
+    if args.folds > 1:
+        start = time.perf_counter()
+        report.accuracy = cross_validate(args.training_file, build, args.folds, args.seed, args.jobs, args.chunk_size)
+        report.timings[f"{args.folds}-fold"] = time.perf_counter() - start
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
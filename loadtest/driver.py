@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import time
+from types import SimpleNamespace
+
+from benchmarks.harness import bootstrap_env
+from loadtest.imap_server import FakeIMAPServer, generate_self_signed_cert, server_ssl_context
+from loadtest.mailboxes import PASSWORD, populate
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _run_pollers(server: FakeIMAPServer, logins, args) -> int:
+    from emails.poller import EmailPoller
+    pollers = [EmailPoller("127.0.0.1", login, PASSWORD, interval=args.interval, port=server.port, user_id=i + 1)
+               for i, login in enumerate(logins)]
+    for poller in pollers:
+        poller.start()
+    await asyncio.sleep(args.duration)
+    for poller in pollers:
+        poller.stop()
+    return sum(len(p.get_emails()) for p in pollers)
+
+
+async def _run_listeners(server: FakeIMAPServer, logins, args) -> int:
+    import auth.models  # noqa: F401
+    from core.database import Base, async_session, engine
+    from emails.listener import _polling_loop_for_user
+    from emails.pipeline import get_pipeline, shutdown_pipeline
+    from emails.models import Email
+    from emails.search import ensure_search_index
+    from sqlalchemy import func, select
+
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_search_index(conn)
+
+    stop_event = asyncio.Event()
+    users = [
+        SimpleNamespace(id=i + 1, email=login, email_password=PASSWORD, email_imap_host="localhost",
+                        email_imap_port=server.port)
+        for i, login in enumerate(logins)
+    ]
+    tasks = [asyncio.create_task(_polling_loop_for_user(user, stop_event, interval=args.interval)) for user in users]
+    await asyncio.sleep(args.duration)
+    stop_event.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    if failed:
+        print(f"[!] {failed} listener(s) ended with an error, first: {next(r for r in results if isinstance(r, Exception))!r}")
+    pipeline = await get_pipeline()
+    drain_start = time.perf_counter()
+    stats = pipeline.stats()
+    await shutdown_pipeline()
+    print("  pipeline at stop: " + ", ".join(f"{stage} depth={s['depth']}" for stage, s in stats.items())
+          + f", drained in {time.perf_counter() - drain_start:.1f}s")
+    async with async_session() as db:
+        stored = (await db.execute(select(func.count()).select_from(Email))).scalar()
+    await engine.dispose()
+    return stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run concurrent pollers against the fake IMAP server.")
+    parser.add_argument("--client", choices=["poller", "listener"], default="poller",
+                        help="poller: emails.poller.EmailPoller, listener: emails.listener polling loop.")
+    parser.add_argument("--mailboxes", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20, help="Messages per mailbox before the run.")
+    parser.add_argument("--pollers", type=int, default=50, help="Concurrent pollers, one mailbox each.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--interval", type=int, default=5, help="Polling interval in seconds.")
+    parser.add_argument("--arrival-rate", type=float, default=5.0, help="New messages per second across mailboxes.")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    bootstrap_env()
+    cert_path, key_path = generate_self_signed_cert()
+    os.environ["SSL_CERT_FILE"] = str(cert_path)
+
+    server = FakeIMAPServer(ssl_context=server_ssl_context(cert_path, key_path), latency=args.latency,
+                            jitter=args.jitter, failure_rate=args.failure_rate, drop_rate=args.drop_rate, seed=args.seed)
+    logins = populate(server, args.mailboxes, args.messages, seed=args.seed)
+    server.start_in_thread()
+    active = logins[:args.pollers]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    if args.arrival_rate > 0:
+        # Arrivals land in every generated mailbox; lag is measured in the polled ones.
+        server.submit(server.run_arrivals(args.arrival_rate, args.duration))
+
+    runner = _run_pollers if args.client == "poller" else _run_listeners
+    start = time.perf_counter()
+    held = asyncio.run(runner(server, active, args))
+    elapsed = time.perf_counter() - start
+    server.stop_thread()
+
+    stats = server.stats
+    lags, missed = server.arrival_lags(active)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"client={args.client} pollers={len(active)} mailboxes={args.mailboxes} duration={elapsed:.1f}s")
+    print(f"  logins={stats.logins} commands={stats.commands} failures={stats.injected_failures} "
+          f"drops={stats.dropped_connections}")
+    print(f"  throughput: {stats.fetched_messages / elapsed:,.1f} messages/s, "
+          f"{stats.bytes_sent / elapsed / 1e6:,.2f} MB/s ({stats.fetched_messages} messages fetched)")
+    print(f"  arrivals: {stats.arrivals} across {len(server.mailboxes)} mailboxes, {len(lags) + missed} in polled ones")
+    print(f"  lag: n={len(lags)} p50={_percentile(lags, 0.5):.2f}s p95={_percentile(lags, 0.95):.2f}s "
+          f"max={max(lags, default=0):.2f}s mean={statistics.fmean(lags) if lags else 0:.2f}s unfetched={missed}")
+    print(f"  client held/stored: {held} emails")
+    print(f"  memory: peak RSS {rss_after:,.1f} MB (setup {rss_before:,.1f} MB, client and server share the process)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,563 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import random
+import re
+import ssl
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("loadtest.imap_server")
+
+CAPABILITIES = "IMAP4rev1 IDLE LITERAL+ UIDPLUS"
+_LITERAL = re.compile(rb"\{(\d+)(\+?)\}\r?\n$")
+
+
+class ConnectionDropped(Exception):
+    pass
+
+
+@dataclass
+class StoredMessage:
+    uid: int
+    template: int
+    appended_at: float
+    flags: Set[str] = field(default_factory=set)
+    first_fetched_at: Optional[float] = None
+    injected: bool = False
+
+
+class Mailbox:
+    def __init__(self, password: str):
+        self.password = password
+        self.messages: List[StoredMessage] = []
+        self.uidnext = 1
+        self.idlers: Set[asyncio.Queue] = set()
+
+    def append(self, template: int, injected: bool = False) -> StoredMessage:
+        message = StoredMessage(uid=self.uidnext, template=template, appended_at=time.monotonic(), injected=injected)
+        self.uidnext += 1
+        self.messages.append(message)
+        for queue in self.idlers:
+            queue.put_nowait(len(self.messages))
+        return message
+
+
+@dataclass
+class ServerStats:
+    connections: int = 0
+    commands: int = 0
+    logins: int = 0
+    fetched_messages: int = 0
+    bytes_sent: int = 0
+    injected_failures: int = 0
+    dropped_connections: int = 0
+    arrivals: int = 0
+
+
+class FakeIMAPServer:
+    """In-process IMAP4rev1 subset: LOGIN, SELECT, SEARCH, (UID) FETCH/STORE/SEARCH, IDLE and LOGOUT"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ssl_context: Optional[ssl.SSLContext] = None,
+                 latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, drop_rate: float = 0.0,
+                 seed: int = 1234):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.mailboxes: Dict[str, Mailbox] = {}
+        self.templates: List[bytes] = []
+        self.stats = ServerStats()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    def add_template(self, raw: bytes) -> int:
+        self.templates.append(raw.replace(b"\r\n", b"\n").replace(b"\n", b"\r\n"))
+        return len(self.templates) - 1
+
+    def add_mailbox(self, login: str, password: str) -> Mailbox:
+        mailbox = self.mailboxes[login] = Mailbox(password)
+        return mailbox
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Fake IMAP server listening on %s:%s (tls=%s)", self.host, self.port, bool(self.ssl_context))
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def start_in_thread(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="fake-imap-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop_thread(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def submit(self, coro):
+        """Schedules ``coro`` on the server thread's loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def run_arrivals(self, rate: float, duration: float):
+        logins = list(self.mailboxes)
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            login = self.rng.choice(logins)
+            self.mailboxes[login].append(self.rng.randrange(len(self.templates)), injected=True)
+            self.stats.arrivals += 1
+            await asyncio.sleep(self.rng.expovariate(rate))
+
+    def arrival_lags(self, logins: Optional[Iterable[str]] = None) -> Tuple[List[float], int]:
+        """Fetch lags of the injected messages and how many were never fetched, in the given mailboxes or all"""
+        lags, missed = [], 0
+        for mailbox in (self.mailboxes.values() if logins is None else (self.mailboxes[login] for login in logins)):
+            for message in mailbox.messages:
+                if not message.injected:
+                    continue
+                if message.first_fetched_at is None:
+                    missed += 1
+                else:
+                    lags.append(message.first_fetched_at - message.appended_at)
+        return lags, missed
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connections += 1
+        session = _Session(self, reader, writer)
+        try:
+            await session.run()
+        except (ConnectionDropped, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            session.close()
+
+
+class _Session:
+    def __init__(self, server: FakeIMAPServer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.login: Optional[str] = None
+        self.mailbox: Optional[Mailbox] = None
+        self.read_only = False
+        self.idle_queue: Optional[asyncio.Queue] = None
+
+    def close(self):
+        if self.mailbox is not None and self.idle_queue is not None:
+            self.mailbox.idlers.discard(self.idle_queue)
+        self.writer.close()
+
+    async def _send(self, data: bytes):
+        self.server.stats.bytes_sent += len(data)
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _line(self, text: str):
+        await self._send(text.encode("utf-8") + b"\r\n")
+
+    async def _read_command(self) -> Optional[bytes]:
+        line = await self.reader.readline()
+        if not line:
+            return None
+        data = line
+        while True:
+            match = _LITERAL.search(data)
+            if not match:
+                break
+            if not match.group(2):
+                await self._line("+ Ready for literal data")
+            data += await self.reader.readexactly(int(match.group(1)))
+            data += await self.reader.readline()
+        return data.rstrip(b"\r\n")
+
+    async def run(self):
+        await self._line(f"* OK [CAPABILITY {CAPABILITIES}] Fake IMAP server ready")
+        while True:
+            raw = await self._read_command()
+            if raw is None:
+                return
+            tokens = _tokenize(raw)
+            if len(tokens) < 2:
+                await self._line(f"{tokens[0] if tokens else '*'} BAD Missing command")
+                continue
+            tag, command, args = tokens[0], tokens[1].upper(), tokens[2:]
+            uid = command == "UID" and bool(args)
+            if uid:
+                command, args = args[0].upper(), args[1:]
+            self.server.stats.commands += 1
+            await self._inject_latency()
+            if await self._inject_failure(tag):
+                continue
+
+            handler = getattr(self, f"cmd_{command.lower()}", None)
+            if handler is None or (uid and command not in ("FETCH", "SEARCH", "STORE")):
+                await self._line(f"{tag} BAD Unknown command {command}")
+            elif self.login is None and command not in ("CAPABILITY", "LOGIN", "LOGOUT", "NOOP"):
+                await self._line(f"{tag} NO Not authenticated")
+            elif self.mailbox is None and command in ("FETCH", "SEARCH", "STORE", "IDLE", "CLOSE", "EXPUNGE"):
+                await self._line(f"{tag} NO No mailbox selected")
+            elif await handler(tag, args, uid) is False:
+                return
+
+    async def _inject_latency(self):
+        delay = self.server.latency + (self.server.rng.uniform(0, self.server.jitter) if self.server.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _inject_failure(self, tag: str) -> bool:
+        rng = self.server.rng
+        if self.server.drop_rate and rng.random() < self.server.drop_rate:
+            self.server.stats.dropped_connections += 1
+            raise ConnectionDropped()
+        if self.server.failure_rate and rng.random() < self.server.failure_rate:
+            self.server.stats.injected_failures += 1
+            await self._line(f"{tag} NO [UNAVAILABLE] Injected failure")
+            return True
+        return False
+
+    async def cmd_capability(self, tag, args, uid):
+        await self._line(f"* CAPABILITY {CAPABILITIES}")
+        await self._line(f"{tag} OK CAPABILITY completed")
+
+    async def cmd_noop(self, tag, args, uid):
+        if self.mailbox is not None:
+            await self._line(f"* {len(self.mailbox.messages)} EXISTS")
+        await self._line(f"{tag} OK NOOP completed")
+
+    cmd_check = cmd_noop
+
+    async def cmd_login(self, tag, args, uid):
+        if len(args) != 2:
+            await self._line(f"{tag} BAD LOGIN expects user and password")
+            return
+        mailbox = self.server.mailboxes.get(args[0])
+        if mailbox is None or mailbox.password != args[1]:
+            await self._line(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+            return
+        self.login = args[0]
+        self.server.stats.logins += 1
+        await self._line(f"{tag} OK [CAPABILITY {CAPABILITIES}] Logged in")
+
+    async def cmd_logout(self, tag, args, uid):
+        await self._line("* BYE Logging out")
+        await self._line(f"{tag} OK LOGOUT completed")
+        return False
+
+    async def cmd_select(self, tag, args, uid, read_only=False):
+        if not args or args[0].upper() != "INBOX":
+            await self._line(f"{tag} NO Mailbox does not exist")
+            return
+        self.mailbox = self.server.mailboxes[self.login]
+        self.read_only = read_only
+        unseen = next((i for i, m in enumerate(self.mailbox.messages, 1) if "\\Seen" not in m.flags), None)
+        await self._line("* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        await self._line(f"* {len(self.mailbox.messages)} EXISTS")
+        await self._line("* 0 RECENT")
+        if unseen:
+            await self._line(f"* OK [UNSEEN {unseen}] First unseen")
+        await self._line("* OK [UIDVALIDITY 1] UIDs valid")
+        await self._line(f"* OK [UIDNEXT {self.mailbox.uidnext}] Predicted next UID")
+        mode = "READ-ONLY" if read_only else "READ-WRITE"
+        await self._line(f"{tag} OK [{mode}] {'EXAMINE' if read_only else 'SELECT'} completed")
+
+    async def cmd_examine(self, tag, args, uid):
+        await self.cmd_select(tag, args, uid, read_only=True)
+
+    async def cmd_close(self, tag, args, uid):
+        self.mailbox = None
+        await self._line(f"{tag} OK CLOSE completed")
+
+    async def cmd_expunge(self, tag, args, uid):
+        await self._line(f"{tag} OK EXPUNGE completed")
+
+    def _resolve(self, spec: str, uid: bool) -> List[Tuple[int, StoredMessage]]:
+        messages = self.mailbox.messages
+        if not messages:
+            return []
+        top = messages[-1].uid if uid else len(messages)
+        wanted = _parse_sequence_set(spec, top)
+        if uid:
+            return [(i, m) for i, m in enumerate(messages, 1) if wanted(m.uid)]
+        return [(i, messages[i - 1]) for i in range(1, len(messages) + 1) if wanted(i)]
+
+    async def cmd_search(self, tag, args, uid):
+        criteria = [a.upper() if isinstance(a, str) else a for a in args]
+        if len(criteria) >= 2 and criteria[0] == "CHARSET":
+            criteria = criteria[2:]
+        matches = list(enumerate(self.mailbox.messages, 1))
+        i = 0
+        while i < len(criteria):
+            key = criteria[i]
+            if key == "UNSEEN":
+                matches = [(n, m) for n, m in matches if "\\Seen" not in m.flags]
+            elif key == "SEEN":
+                matches = [(n, m) for n, m in matches if "\\Seen" in m.flags]
+            elif key == "UID" and i + 1 < len(criteria):
+                allowed = {m.uid for _, m in self._resolve(criteria[i + 1], True)}
+                matches = [(n, m) for n, m in matches if m.uid in allowed]
+                i += 1
+            elif key not in ("ALL", "NEW", "RECENT"):
+                try:
+                    allowed = {n for n, _ in self._resolve(key, False)}
+                except ValueError:
+                    await self._line(f"{tag} BAD Unsupported search key {key}")
+                    return
+                matches = [(n, m) for n, m in matches if n in allowed]
+            i += 1
+        found = " ".join(str(m.uid if uid else n) for n, m in matches)
+        await self._line(f"* SEARCH {found}".rstrip())
+        await self._line(f"{tag} OK SEARCH completed")
+
+    async def cmd_fetch(self, tag, args, uid):
+        if len(args) < 2:
+            await self._line(f"{tag} BAD FETCH expects a sequence set and items")
+            return
+        items = args[1] if isinstance(args[1], list) else args[1:]
+        items = _expand_fetch_macros([str(item).upper() for item in items])
+        if uid and "UID" not in items:
+            items.insert(0, "UID")
+        now = time.monotonic()
+        for number, message in self._resolve(args[0], uid):
+            raw = self.server.templates[message.template]
+            parts: List[bytes] = []
+            for item in items:
+                parts.append(self._fetch_item(item, message, raw, now))
+            await self._send(f"* {number} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+        await self._line(f"{tag} OK FETCH completed")
+
+    def _fetch_item(self, item: str, message: StoredMessage, raw: bytes, now: float) -> bytes:
+        if item == "UID":
+            return f"UID {message.uid}".encode()
+        if item == "FLAGS":
+            return f"FLAGS ({' '.join(sorted(message.flags))})".encode()
+        if item == "RFC822.SIZE":
+            return f"RFC822.SIZE {len(raw)}".encode()
+        if item == "INTERNALDATE":
+            stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%d-%b-%Y %H:%M:%S +0000")
+            return f'INTERNALDATE "{stamp}"'.encode()
+        header_only = "HEADER" in item
+        body = raw.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n" if header_only else raw
+        if not header_only:
+            self.server.stats.fetched_messages += 1
+            if message.first_fetched_at is None:
+                message.first_fetched_at = now
+        if ".PEEK" not in item and not header_only and not self.read_only:
+            message.flags.add("\\Seen")
+        name = item.replace(".PEEK", "")
+        return f"{name} {{{len(body)}}}\r\n".encode() + body
+
+    async def cmd_store(self, tag, args, uid):
+        if len(args) < 3:
+            await self._line(f"{tag} BAD STORE expects a sequence set, an action and flags")
+            return
+        action = args[1].upper()
+        flags = set(args[2] if isinstance(args[2], list) else args[2:])
+        for number, message in self._resolve(args[0], uid):
+            if action.startswith("+FLAGS"):
+                message.flags |= flags
+            elif action.startswith("-FLAGS"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            if not action.endswith(".SILENT"):
+                uid_part = f"UID {message.uid} " if uid else ""
+                await self._line(f"* {number} FETCH ({uid_part}FLAGS ({' '.join(sorted(message.flags))}))")
+        await self._line(f"{tag} OK STORE completed")
+
+    async def cmd_idle(self, tag, args, uid):
+        self.idle_queue = asyncio.Queue()
+        self.mailbox.idlers.add(self.idle_queue)
+        await self._line("+ idling")
+        done = asyncio.ensure_future(self.reader.readline())
+        try:
+            while True:
+                notify = asyncio.ensure_future(self.idle_queue.get())
+                finished, _ = await asyncio.wait({done, notify}, return_when=asyncio.FIRST_COMPLETED)
+                if notify in finished:
+                    await self._line(f"* {notify.result()} EXISTS")
+                else:
+                    notify.cancel()
+                    break
+        finally:
+            self.mailbox.idlers.discard(self.idle_queue)
+            self.idle_queue = None
+        if not done.result():
+            return False
+        await self._line(f"{tag} OK IDLE terminated")
+
+
+def _tokenize(data: bytes) -> list:
+    tokens, stack, i, n = [], [], 0, len(data)
+    current = tokens
+    while i < n:
+        c = data[i:i + 1]
+        if c == b" ":
+            i += 1
+        elif c == b"(":
+            stack.append(current)
+            new = []
+            current.append(new)
+            current = new
+            i += 1
+        elif c == b")":
+            current = stack.pop() if stack else tokens
+            i += 1
+        elif c == b'"':
+            j, buf = i + 1, bytearray()
+            while j < n and data[j:j + 1] != b'"':
+                if data[j:j + 1] == b"\\":
+                    j += 1
+                buf += data[j:j + 1]
+                j += 1
+            current.append(buf.decode("utf-8", errors="replace"))
+            i = j + 1
+        elif c == b"{":
+            close = data.index(b"}", i)
+            size = int(data[i + 1:close].rstrip(b"+"))
+            start = data.index(b"\n", close) + 1
+            current.append(data[start:start + size].decode("utf-8", errors="replace"))
+            i = start + size
+        else:
+            j = i
+            depth = 0
+            while j < n:
+                ch = data[j:j + 1]
+                if ch == b"[":
+                    depth += 1
+                elif ch == b"]":
+                    depth -= 1
+                elif depth == 0 and ch in (b" ", b"(", b")"):
+                    break
+                j += 1
+            current.append(data[i:j].decode("utf-8", errors="replace"))
+            i = j
+    return tokens
+
+
+def _parse_sequence_set(spec: str, top: int):
+    ranges = []
+    for part in spec.split(","):
+        if ":" in part:
+            lo, hi = part.split(":", 1)
+        else:
+            lo = hi = part
+        lo = top if lo == "*" else int(lo)
+        hi = top if hi == "*" else int(hi)
+        ranges.append((min(lo, hi), max(lo, hi)))
+    return lambda value: any(lo <= value <= hi for lo, hi in ranges)
+
+
+def _expand_fetch_macros(items: List[str]) -> List[str]:
+    macros = {
+        "ALL": ["FLAGS", "INTERNALDATE", "RFC822.SIZE"],
+        "FAST": ["FLAGS", "INTERNALDATE", "RFC822.SIZE"],
+        "FULL": ["FLAGS", "INTERNALDATE", "RFC822.SIZE"],
+    }
+    out = []
+    for item in items:
+        out.extend(macros.get(item, [item]))
+    return out
+
+
+def generate_self_signed_cert(directory: str = None, hostname: str = "localhost") -> Tuple[Path, Path]:
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    out = Path(directory or tempfile.mkdtemp(prefix="fake-imap-"))
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName(hostname),
+            x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = out / "cert.pem", out / "key.pem"
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def server_ssl_context(cert_path: Path, key_path: Path) -> ssl.SSLContext:
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def main():
+    from loadtest.mailboxes import populate
+
+    parser = argparse.ArgumentParser(description="Run a fake IMAP4rev1 server with synthetic mailboxes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9993)
+    parser.add_argument("--tls", action="store_true", help="Serve IMAPS with a generated self-signed certificate.")
+    parser.add_argument("--mailboxes", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20, help="Messages per mailbox.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every command.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability of a NO response per command.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability of dropping the connection per command.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    context = None
+    if args.tls:
+        cert_path, key_path = generate_self_signed_cert()
+        context = server_ssl_context(cert_path, key_path)
+        print(f"[+] Self-signed certificate: {cert_path}")
+    server = FakeIMAPServer(args.host, args.port, ssl_context=context, latency=args.latency, jitter=args.jitter,
+                            failure_rate=args.failure_rate, drop_rate=args.drop_rate)
+    logins = populate(server, args.mailboxes, args.messages)
+    print(f"[+] {len(logins)} mailboxes, e.g. {logins[0]} / password: secret")
+
+    async def serve():
+        await server.start()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
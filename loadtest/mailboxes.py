@@ -0,0 +1,28 @@
+import random
+from typing import List
+
+from benchmarks.corpus import build_message, load_bodies
+
+PASSWORD = "secret"
+DOMAIN = "loadtest.local"
+
+
+def mailbox_login(index: int) -> str:
+    return f"user{index:05d}@{DOMAIN}"
+
+
+def populate(server, mailboxes: int, messages_per_mailbox: int, templates: int = 200, seed: int = 1234) -> List[str]:
+    """Creates ``mailboxes`` accounts; messages share a pool of templates so memory stays flat"""
+    rng = random.Random(seed)
+    bodies = load_bodies()
+    first = len(server.templates)
+    for i in range(templates):
+        server.add_template(build_message(rng, bodies, i))
+    logins = []
+    for i in range(mailboxes):
+        login = mailbox_login(i)
+        mailbox = server.add_mailbox(login, PASSWORD)
+        for _ in range(messages_per_mailbox):
+            mailbox.append(first + rng.randrange(templates))
+        logins.append(login)
+    return logins
@@ -1,14 +1,48 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from auth.routes import router as auth_router
+from admin.routes import router as admin_router
+from auth.dependencies import get_current_superuser
 from emails.router import router as email_router
-from core.database import Base, engine
+from core.config import settings
+from core.database import Base, engine, add_missing_columns
+from emails.models import Email
+from emails.search import ensure_search_index
+from emails.retention import ensure_archive_storage, retention_loop
+from emails.pipeline import shutdown_pipeline
+from core.metrics import registry as metrics_registry
+from core.middleware import MetricsMiddleware, ProfilingMiddleware
+from core.responses import TimedJSONResponse
 
-app = FastAPI(title="Email Analyzer SaaS")
+app = FastAPI(title="Email Analyzer SaaS", default_response_class=TimedJSONResponse)
+metrics_registry.enabled = settings.METRICS_ENABLED
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns, Email.__table__)
+        await ensure_search_index(conn)
+        await ensure_archive_storage(conn)
+    if settings.RETENTION_ENABLED:
+        app.state.retention_task = asyncio.create_task(retention_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    task = getattr(app.state, "retention_task", None)
+    if task:
+        task.cancel()
+    await shutdown_pipeline()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(user=Depends(get_current_superuser)):
+    if not metrics_registry.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 app.include_router(auth_router)
-app.include_router(email_router)
\ No newline at end of file
+app.include_router(email_router)
+app.include_router(admin_router)
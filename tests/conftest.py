@@ -0,0 +1,67 @@
+import base64
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Settings are read when core.config is first imported, so the test environment goes in before any app module.
+os.chdir(REPO_ROOT)
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(tempfile.mkdtemp(prefix='mailer-tests-')) / 'test.db'}"
+os.environ["PROJECT_NAME"] = "mailer-tests"
+os.environ["SECRET_KEY"] = "test-secret"
+os.environ["ALGORITHM"] = "HS256"
+os.environ["FERNET_KEY"] = base64.urlsafe_b64encode(os.urandom(32)).decode()
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """An empty schema, search index included, on the throwaway SQLite database"""
+    import auth.models  # noqa: F401
+    import emails.models  # noqa: F401
+    from sqlalchemy import text
+    from core.database import Base, engine
+    from emails.search import ensure_search_index
+
+    engine.sync_engine.echo = False
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS emails_fts"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_search_index(conn)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def make_user(database):
+    """Creates a user and returns it with the Authorization header for it"""
+    from auth.models import User
+    from auth.services import generate_token
+    from core.database import async_session
+
+    async def make(email: str, is_superuser: bool = False):
+        async with async_session() as db:
+            user = User(email=email, hashed_password="x", is_superuser=is_superuser)
+            db.add(user)
+            await db.commit()
+            await db.refresh(user)
+        return user, {"Authorization": f"Bearer {generate_token(user.id, user.email)}"}
+
+    return make
+
+
+@pytest.fixture
+async def client(database):
+    import httpx
+    from main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from core.admission import AdmissionController, TokenBucket
+
+pytestmark = pytest.mark.anyio
+
+
+def _controller(**overrides) -> AdmissionController:
+    options = dict(rate=2.0, burst=4, max_concurrent=1, max_queued=0, queue_timeout=0.05)
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+async def _hold_slot(controller: AdmissionController, user_id: int, release: asyncio.Event, held: asyncio.Event):
+    async with controller.admit(user_id, 1):
+        held.set()
+        await release.wait()
+
+
+def test_bucket_charges_oversized_requests_once_full():
+    bucket = TokenBucket(rate=1.0, capacity=5, now=0.0)
+    assert bucket.take(8, now=0.0) == 0.0
+    assert bucket.tokens == -3
+    assert bucket.take(1, now=1.0) == pytest.approx(3.0)
+
+
+async def test_over_quota_gets_429_with_retry_after():
+    controller = _controller()
+    async with controller.admit(1, 4):
+        pass
+    with pytest.raises(HTTPException) as error:
+        async with controller.admit(1, 2):
+            pass
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+    # Quotas are per user.
+    async with controller.admit(2, 4):
+        pass
+
+
+async def test_full_queue_gets_503_and_refunds_the_quota():
+    controller = _controller()
+    release, held = asyncio.Event(), asyncio.Event()
+    holder = asyncio.create_task(_hold_slot(controller, 1, release, held))
+    await held.wait()
+    try:
+        with pytest.raises(HTTPException) as error:
+            async with controller.admit(2, 3):
+                pass
+        assert error.value.status_code == 503
+        assert int(error.value.headers["Retry-After"]) >= 1
+        assert controller._bucket(2).tokens == pytest.approx(4, abs=0.1)
+    finally:
+        release.set()
+        await holder
+
+
+async def test_queue_timeout_gets_503():
+    controller = _controller(max_queued=1)
+    release, held = asyncio.Event(), asyncio.Event()
+    holder = asyncio.create_task(_hold_slot(controller, 1, release, held))
+    await held.wait()
+    try:
+        with pytest.raises(HTTPException) as error:
+            async with controller.admit(2, 1):
+                pass
+        assert error.value.status_code == 503
+        assert error.value.detail == "Timed out waiting for capacity"
+        assert "Retry-After" in error.value.headers
+        assert controller.queued == 0
+    finally:
+        release.set()
+        await holder
+
+
+async def test_queued_request_runs_once_a_slot_frees():
+    controller = _controller(max_queued=1, queue_timeout=5.0)
+    release, held = asyncio.Event(), asyncio.Event()
+    holder = asyncio.create_task(_hold_slot(controller, 1, release, held))
+    await held.wait()
+    asyncio.get_running_loop().call_later(0.05, release.set)
+    async with controller.admit(2, 1):
+        assert controller.in_flight == 1
+    await holder
+    assert controller.in_flight == 0
+
+
+async def test_endpoint_returns_429_with_retry_after(client, make_user, monkeypatch):
+    from core import admission
+
+    monkeypatch.setattr(admission, "_controller", _controller(rate=0.5, burst=1))
+    _, headers = await make_user("user@mailer.test")
+    first = await client.get("/mail/analyze-single", params={"text": "Siparişim hasarlı geldi"}, headers=headers)
+    assert first.status_code == 200
+    second = await client.get("/mail/analyze-single", params={"text": "Siparişim hasarlı geldi"}, headers=headers)
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "2"
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from emails import dedup
+from emails.analysis import get_analyzer
+
+
+@pytest.fixture(scope="module")
+def texts():
+    with open("training_data.json", "r", encoding="utf-8") as f:
+        bodies = [x["body"] for x in json.load(f)]
+    # Templated copies with changed order numbers, plus a few unique short texts that only cluster when identical.
+    return [f"{bodies[i % len(bodies)]} Sipariş no {1000 + i}" for i in range(120)] + ["Teşekkürler", "Teşekkürler"]
+
+
+@pytest.fixture(params=[True, False], ids=["dedup", "no-dedup"])
+def dedup_enabled(request, monkeypatch):
+    from core.config import settings
+    monkeypatch.setattr(settings, "DEDUP_ENABLED", request.param)
+    monkeypatch.setattr(dedup, "_registry", None)
+    return request.param
+
+
+def _full_path(analyzer, texts, head, value):
+    results = [dedup.analyze_with_dedup(analyzer, 1, text) for text in texts]
+    return [(i, analysis, cluster_id) for i, (analysis, cluster_id) in enumerate(results) if analysis[head] == value]
+
+
+@pytest.mark.parametrize("head", ["priority", "department"])
+def test_cascade_matches_the_full_path(texts, dedup_enabled, head):
+    analyzer = get_analyzer()
+    for value in sorted({analysis[head] for analysis in analyzer.predict_detailed_batch(texts)}):
+        dedup._registry = None
+        expected = _full_path(analyzer, texts, head, value)
+        dedup._registry = None
+        assert dedup.filter_with_dedup(analyzer, 1, texts, head, value) == expected
+        # The clusters the first call left behind give the same answer.
+        assert dedup.filter_with_dedup(analyzer, 1, texts, head, value) == expected
+
+
+def test_only_matches_are_analyzed_in_full_and_registered(texts, dedup_enabled, monkeypatch):
+    analyzer = get_analyzer()
+    value = analyzer.predict_detailed(texts[0])["priority"]
+    analyzed = []
+    predict_detailed_batch = analyzer.predict_detailed_batch
+
+    def counting(batch):
+        analyzed.extend(batch)
+        return predict_detailed_batch(batch)
+
+    monkeypatch.setattr(analyzer, "predict_detailed_batch", counting)
+    matches = dedup.filter_with_dedup(analyzer, 1, texts, "priority", value)
+    assert 0 < len(matches) < len(texts)
+    assert set(analyzed) <= {texts[i] for i, _, _ in matches}
+
+    clusters = [cluster for index in dedup.get_dedup_registry()._indexes.values()
+                for cluster in index._clusters.values()]
+    assert all(type(cluster.analysis) is dict for cluster in clusters)
+    assert all(cluster.analysis["priority"] == value for cluster in clusters)
+    if dedup_enabled:
+        assert len(analyzed) == len(clusters) < len(matches)
+    else:
+        assert len(analyzed) == len(matches) and not clusters
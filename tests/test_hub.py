@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def _store(user_id: int, count: int):
+    from emails.pipeline import IngestItem, IngestPipeline
+    items = [IngestItem(user_id, "push@mailer.test",
+                        parsed={"sender": "a@b.c", "to": "push@mailer.test", "subject": "konu", "body": "govde"})
+             for _ in range(count)]
+    return await IngestPipeline()._persist(items)
+
+
+async def _next_email(events) -> int:
+    kind, event = await asyncio.wait_for(events.__anext__(), 5)
+    assert kind == "email"
+    return event["id"]
+
+
+async def test_replay_hands_over_to_live_events_without_gaps(make_user, monkeypatch):
+    from core.config import settings
+    from emails.hub import PushHub, stream_events
+
+    monkeypatch.setattr(settings, "PUSH_REPLAY_PAGE", 2)
+    user, _ = await make_user("push@mailer.test")
+    hub = PushHub(buffer_size=100)
+    seen = await _store(user.id, 3)
+    events = stream_events(hub, user.id, cursor=seen[0].id)
+    try:
+        received = [await _next_email(events)]
+        # Stored and published while the replay is still paging, so it reaches the client both ways. It also
+        # leaves the last replay page short, which ends the replay.
+        during = await _store(user.id, 1)
+        await hub.publish_emails(during)
+        received += [await _next_email(events) for _ in range(2)]
+        # Batches can commit out of id order; live events are passed on in arrival order.
+        after = await _store(user.id, 2)
+        await hub.publish_emails(after[::-1])
+        received += [await _next_email(events) for _ in range(2)]
+        assert received == [e.id for e in seen[1:] + during + after[::-1]]
+        assert hub.subscriber_count(user.id) == 1
+    finally:
+        await events.aclose()
+    assert hub.subscriber_count(user.id) == 0
+
+
+async def test_slow_subscriber_is_disconnected(make_user):
+    from emails.hub import PushHub, stream_events
+
+    user, _ = await make_user("push@mailer.test")
+    hub = PushHub(buffer_size=1)
+    events = stream_events(hub, user.id, heartbeat=0.05)
+    try:
+        assert await asyncio.wait_for(events.__anext__(), 5) == ("heartbeat", None)
+        await hub.publish_emails(await _store(user.id, 2))
+        assert await asyncio.wait_for(events.__anext__(), 5) == ("closed", "slow consumer")
+    finally:
+        await events.aclose()
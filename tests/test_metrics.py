@@ -0,0 +1,22 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_metrics_requires_a_token(client):
+    response = await client.get("/metrics")
+    assert response.status_code == 401
+
+
+async def test_metrics_is_forbidden_to_regular_users(client, make_user):
+    _, headers = await make_user("user@mailer.test")
+    response = await client.get("/metrics", headers=headers)
+    assert response.status_code == 403
+
+
+async def test_metrics_renders_for_superusers(client, make_user):
+    _, headers = await make_user("admin@mailer.test", is_superuser=True)
+    response = await client.get("/metrics", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE mailer_http_request_duration_seconds histogram" in response.text
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+class _StaticPoller:
+    def __init__(self, emails):
+        self.emails = emails
+
+    def get_emails(self):
+        return self.emails
+
+
+async def test_request_profile_includes_threadpool_analysis(client, make_user, monkeypatch):
+    from core.admission import admission_disabled
+    from core.config import settings
+    from emails import router as email_router
+
+    _, headers = await make_user("admin@mailer.test", is_superuser=True)
+    with open("training_data.json", "r", encoding="utf-8") as f:
+        bodies = [x["body"] for x in json.load(f)]
+    emails = [{"subject": "s", "from": "a@b.c", "body": f"{bodies[i % len(bodies)]} {i}"} for i in range(600)]
+    monkeypatch.setitem(email_router.pollers, "admin@mailer.test", _StaticPoller(emails))
+    # Every email is classified, so the analysis takes long enough to be sampled.
+    monkeypatch.setattr(settings, "DEDUP_ENABLED", False)
+
+    with admission_disabled():
+        response = await client.get("/mail/stats", params={"email": "admin@mailer.test"},
+                                    headers={**headers, "X-Profile": "1"})
+    assert response.status_code == 200
+    assert response.json()["total_emails"] == 600
+
+    profile = await client.get(f"/admin/profiles/{response.headers['x-profile-id']}", headers=headers)
+    assert profile.status_code == 200
+    analysis = [line for line in profile.text.splitlines() if "predict_detailed" in line]
+    assert analysis
+    assert all("_analyze_bodies" in line for line in analysis)
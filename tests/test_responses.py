@@ -0,0 +1,26 @@
+import json
+import math
+
+import numpy as np
+import pytest
+from fastapi.responses import JSONResponse
+
+from core.responses import TimedJSONResponse
+
+
+@pytest.mark.parametrize("value", [
+    math.nan, math.inf, -math.inf, np.float64("nan"), np.float32("inf"), np.array([1.0, np.nan]),
+])
+@pytest.mark.parametrize("wrap", [
+    lambda v: v, lambda v: {"analysis": {"confidence_score": v}}, lambda v: [{"scores": (0.5, v)}],
+])
+def test_non_finite_floats_are_rejected(value, wrap):
+    with pytest.raises(ValueError, match="not JSON compliant"):
+        TimedJSONResponse(wrap(value))
+
+
+def test_finite_content_renders_like_json_response():
+    content = [{"subject": "Sipariş", "analysis": {"confidence_score": 0.1234, "priority": "yüksek"},
+                "cluster_id": None, "count": 3, "read": False}]
+    assert TimedJSONResponse(content).body == JSONResponse(content).body
+    assert json.loads(TimedJSONResponse({"scores": np.array([0.5, 1.0])}).body) == {"scores": [0.5, 1.0]}
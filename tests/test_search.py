@@ -0,0 +1,73 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def _analysis(priority: str) -> dict:
+    return {"category": "fatura", "subcategory": "odeme", "priority": priority, "sentiment": "notr",
+            "urgency": "normal", "department": "muhasebe", "confidence_score": 0.5}
+
+
+async def _store(user_id: int, mailbox: str, bodies, priorities=None):
+    from emails.pipeline import IngestItem, IngestPipeline
+    items = [IngestItem(user_id, mailbox, analysis=_analysis((priorities or {}).get(i, "normal")),
+                        parsed={"sender": "a@b.c", "to": mailbox, "subject": f"konu {i}", "body": body})
+             for i, body in enumerate(bodies)]
+    stored = await IngestPipeline()._persist(items)
+    return [email.id for email in stored]
+
+
+async def _search_all(client, headers, limit: int, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = {"q": "fatura", "limit": limit, **params}
+        if cursor:
+            query["cursor"] = cursor
+        response = await client.get("/mail/search", params=query, headers=headers)
+        assert response.status_code == 200
+        page = response.json()
+        ids += [item["id"] for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, pages
+
+
+@pytest.fixture
+async def mailboxes(make_user):
+    alice, alice_headers = await make_user("alice@mailer.test")
+    bob, bob_headers = await make_user("bob@mailer.test")
+    # Repeated bodies rank equally, so paging has to break ties by id.
+    bodies = [f"fatura {'gecikme ' * (i % 4)}odeme hatirlatma" for i in range(23)]
+    alice_ids = await _store(alice.id, alice.email, bodies, {i: "yüksek" for i in range(0, 23, 3)})
+    await _store(alice.id, alice.email, ["siparis kargo teslimat"] * 5)
+    bob_ids = await _store(bob.id, bob.email, ["fatura iade talebi"] * 9)
+    return alice_ids, alice_headers, bob_ids, bob_headers
+
+
+async def test_pages_cover_every_match_once(client, mailboxes):
+    alice_ids, alice_headers, _, _ = mailboxes
+    ids, pages = await _search_all(client, alice_headers, limit=5)
+    assert sorted(ids) == sorted(alice_ids)
+    assert len(ids) == len(set(ids))
+    assert pages == 5
+
+
+async def test_results_are_limited_to_the_owner(client, mailboxes):
+    alice_ids, alice_headers, bob_ids, bob_headers = mailboxes
+    ids, _ = await _search_all(client, bob_headers, limit=4)
+    assert sorted(ids) == sorted(bob_ids)
+    assert not set(ids) & set(alice_ids)
+
+
+async def test_label_filters_apply_across_pages(client, mailboxes):
+    alice_ids, alice_headers, _, _ = mailboxes
+    ids, _ = await _search_all(client, alice_headers, limit=3, priority="yüksek")
+    assert sorted(ids) == [alice_ids[i] for i in range(0, 23, 3)]
+
+
+async def test_invalid_cursor_is_rejected(client, mailboxes):
+    _, alice_headers, _, _ = mailboxes
+    response = await client.get("/mail/search", params={"q": "fatura", "cursor": "not-a-cursor"},
+                                headers=alice_headers)
+    assert response.status_code == 400
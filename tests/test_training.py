@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.naive_bayes import MultinomialNB
+
+from emails.preprocessing import build_vectorizer
+from emails.training import HEADS, cross_validate, fit_streaming, iter_examples
+
+
+@pytest.fixture(scope="module")
+def examples():
+    with open("training_data.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _fit_in_memory(examples, preset):
+    vectorizer = build_vectorizer(preset)
+    X = vectorizer.fit_transform([x["body"] for x in examples])
+    return vectorizer, {head: MultinomialNB().fit(X, [x[head] for x in examples]) for head in HEADS}
+
+
+def _assert_same_model(expected, actual, examples):
+    (expected_vectorizer, expected_heads), (actual_vectorizer, actual_heads) = expected, actual
+    assert actual_vectorizer.vocabulary_ == expected_vectorizer.vocabulary_
+    np.testing.assert_allclose(actual_vectorizer.idf_, expected_vectorizer.idf_)
+    X = expected_vectorizer.transform([x["body"] for x in examples])
+    for head in HEADS:
+        assert list(actual_heads[head].classes_) == list(expected_heads[head].classes_)
+        np.testing.assert_allclose(actual_heads[head].feature_log_prob_, expected_heads[head].feature_log_prob_)
+        assert list(actual_heads[head].predict(X)) == list(expected_heads[head].predict(X))
+
+
+@pytest.mark.parametrize("preset", ["default", "tiny"])
+@pytest.mark.parametrize("chunk_size", [7, 5000])
+def test_streaming_fit_matches_in_memory_fit(examples, preset, chunk_size):
+    vectorizer, heads = build_vectorizer(preset), {head: MultinomialNB() for head in HEADS}
+    mappings, report = fit_streaming(vectorizer, heads, "training_data.json", chunk_size=chunk_size)
+    _assert_same_model(_fit_in_memory(examples, preset), (vectorizer, heads), examples)
+    assert report.documents == len(examples)
+    assert mappings["action_required"] == {x["subcategory"]: x["action_required"] for x in examples}
+
+
+def test_parallel_jsonl_fit_matches_in_memory_fit(examples, tmp_path):
+    path = tmp_path / "training.jsonl"
+    path.write_text("".join(json.dumps(x, ensure_ascii=False) + "\n" for x in examples), encoding="utf-8")
+    assert list(iter_examples(path)) == examples
+    vectorizer, heads = build_vectorizer("default"), {head: MultinomialNB() for head in HEADS}
+    fit_streaming(vectorizer, heads, path, n_jobs=2, chunk_size=7)
+    _assert_same_model(_fit_in_memory(examples, "default"), (vectorizer, heads), examples)
+
+
+def test_cross_validate_scores_every_head():
+    def build():
+        return build_vectorizer("default"), {head: MultinomialNB() for head in HEADS}
+
+    accuracy = cross_validate("training_data.json", build, folds=3)
+    assert set(accuracy) == set(HEADS)
+    assert all(0.0 <= value <= 1.0 for value in accuracy.values())
+    assert accuracy == cross_validate("training_data.json", build, folds=3)
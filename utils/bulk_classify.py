@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+_FROM_ESCAPE = re.compile(rb"^>+From ")
+_LABELS = ("category", "subcategory", "priority", "sentiment", "urgency", "department",
+           "action_required", "response_template")
+
+
+# --- sources -------------------------------------------------------------------------------------------
+# Each source yields (key, resume, raw): key identifies the message, resume is the position to restart
+# from once it has been handled (a byte offset for mbox files, the relative path of the file for directories).
+
+def _read_mbox(path: Path, start: int = 0) -> Iterator[Tuple[str, int, bytes]]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        message_start, lines, previous_blank = None, [], True
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if message_start is not None:
+                    yield f"{path}:{message_start}", offset, b"".join(lines)
+                message_start, lines = offset, []
+            elif message_start is not None:
+                # mboxrd quoting: one ">" was added in front of every line that looked like a separator.
+                lines.append(line[1:] if _FROM_ESCAPE.match(line) else line)
+            previous_blank = line in (b"\n", b"\r\n")
+            offset += len(line)
+        if message_start is not None:
+            yield f"{path}:{message_start}", offset, b"".join(lines)
+
+
+def _walk_sorted(directory: Path, after: Tuple[str, ...] = (), recursive: bool = True) -> Iterator[Tuple[str, ...]]:
+    """Relative paths, as parts, of the files under directory in name order and past the after path
+
+    Only one directory listing is held at a time, and subdirectories wholly before after are not entered.
+    """
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if after and entry.name < after[0]:
+            continue
+        inner = after[1:] if after and entry.name == after[0] else ()
+        if entry.is_dir():
+            if recursive:
+                for parts in _walk_sorted(Path(entry.path), inner):
+                    yield (entry.name,) + parts
+        elif entry.is_file() and not (after and entry.name == after[0] and not inner):
+            yield (entry.name,)
+
+
+def _message_files(path: Path, after: Tuple[str, ...] = ()) -> Iterator[Tuple[str, ...]]:
+    if all((path / sub).is_dir() for sub in ("cur", "new")):
+        for sub in ("cur", "new"):
+            if not after or sub >= after[0]:
+                inner = after[1:] if after and sub == after[0] else ()
+                for parts in _walk_sorted(path / sub, inner, recursive=False):
+                    yield (sub,) + parts
+        return
+    for parts in _walk_sorted(path, after):
+        if parts[-1].endswith(".eml"):
+            yield parts
+
+
+def _read_files(path: Path, start: Union[int, str] = 0) -> Iterator[Tuple[str, str, bytes]]:
+    after = tuple(start.split("/")) if isinstance(start, str) and start else ()
+    for parts in _message_files(path, after):
+        file = path.joinpath(*parts)
+        yield str(file), "/".join(parts), file.read_bytes()
+
+
+def iter_messages(inputs: List[Path], source: int = 0,
+                  position: Union[int, str] = 0) -> Iterator[Tuple[int, str, Union[int, str], bytes]]:
+    """Streams (source index, key, resume position, raw message) over all inputs, starting at a checkpoint"""
+    for index in range(source, len(inputs)):
+        path = inputs[index]
+        start = position if index == source else 0
+        if path.is_dir():
+            reader = _read_files(path, start)
+        elif path.suffix.lower() == ".eml":
+            reader = iter([(str(path), 1, path.read_bytes())] if start == 0 else [])
+        else:
+            reader = _read_mbox(path, start)
+        for key, resume, raw in reader:
+            yield index, key, resume, raw
+
+
+# --- workers -------------------------------------------------------------------------------------------
+
+def _init_worker():
+    from emails.analysis import get_analyzer
+    get_analyzer()
+
+
+def _classify_messages(batch: List[Tuple[str, bytes]]) -> List[Dict[str, Any]]:
+    from emails.analysis import get_analyzer
+    from emails.parsing import parse_message
+
+    records, texts = [], []
+    for key, raw in batch:
+        try:
+            record = parse_message(raw)
+            texts.append(record["body"])
+        except Exception as e:
+            record = {"error": f"{type(e).__name__}: {e}"}
+        record["key"] = key
+        records.append(record)
+    analyses = iter(get_analyzer().predict_detailed_batch(texts))
+    for record in records:
+        if "error" not in record:
+            analysis = next(analyses)
+            record["analysis"] = {k: str(analysis[k]) for k in _LABELS}
+            record["analysis"]["confidence_score"] = float(analysis["confidence_score"])
+    return records
+
+
+# --- outputs -------------------------------------------------------------------------------------------
+
+# Writers persist the checkpoint state together with each batch: open(resume) returns the saved state, if any,
+# and write(records, state) stores the records and then state.
+
+class JsonlWriter:
+    def __init__(self, path: Path, checkpoint: Path, include_body: bool = False):
+        self.path = path
+        self.checkpoint = checkpoint
+        self.include_body = include_body
+        self.file = None
+
+    async def open(self, resume: bool) -> Optional[Dict[str, Any]]:
+        saved = json.loads(self.checkpoint.read_text()) if resume and self.checkpoint.exists() else None
+        self.file = open(self.path, "r+b" if saved is not None and self.path.exists() else "wb")
+        if saved is not None:
+            # Drop lines written after the last checkpoint so a resumed run does not repeat them.
+            self.file.truncate(saved["output_bytes"])
+            self.file.seek(saved["output_bytes"])
+        return saved
+
+    async def write(self, records: List[Dict[str, Any]], state: Dict[str, Any]):
+        for record in records:
+            if not self.include_body:
+                record.pop("body", None)
+            self.file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.file.flush()
+        state["output_bytes"] = self.file.tell()
+        _save_checkpoint(self.checkpoint, state)
+
+    async def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def _received_at(date: Optional[str]) -> datetime:
+    try:
+        value = parsedate_to_datetime(date)
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    except (TypeError, ValueError, IndexError):
+        return datetime.utcnow()
+
+
+class DatabaseWriter:
+    """Inserts into emails; the checkpoint lives in the database and commits with each batch"""
+
+    def __init__(self, user_id: int, checkpoint: str):
+        self.user_id = user_id
+        self.checkpoint = checkpoint
+
+    async def open(self, resume: bool) -> Optional[Dict[str, Any]]:
+        from sqlalchemy import text
+        from core.database import Base, engine, add_missing_columns
+        from emails.models import Email
+        from emails.search import ensure_search_index
+        import auth.models  # noqa: F401
+
+        engine.sync_engine.echo = False
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(add_missing_columns, Email.__table__)
+            await ensure_search_index(conn)
+            await conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS bulk_classify_checkpoints (name VARCHAR PRIMARY KEY, state TEXT NOT NULL)"))
+            if not resume:
+                return None
+            saved = (await conn.execute(text("SELECT state FROM bulk_classify_checkpoints WHERE name = :name"),
+                                        {"name": self.checkpoint})).scalar()
+        return json.loads(saved) if saved is not None else None
+
+    async def write(self, records: List[Dict[str, Any]], state: Dict[str, Any]):
+        from sqlalchemy import text
+        from core.database import async_session
+        from emails.pipeline import build_email
+        from emails.search import index_email
+
+        rows = []
+        async with async_session() as db:
+            for record in records:
+                if "error" in record:
+                    continue
+                email, body = build_email(self.user_id, record["sender"] or "", record["to"] or "",
+                                          record["subject"], record["body"], record["analysis"])
+                email.received_at = _received_at(record["date"])
+                rows.append((email, body))
+            db.add_all([email for email, _ in rows])
+            await db.flush()
+            for email, body in rows:
+                await index_email(db, email.id, email.user_id, email.subject, body)
+            # Same transaction as the rows, so a resumed run never inserts a committed batch again.
+            params = {"name": self.checkpoint, "state": json.dumps(state)}
+            await db.execute(text("DELETE FROM bulk_classify_checkpoints WHERE name = :name"), params)
+            await db.execute(text("INSERT INTO bulk_classify_checkpoints (name, state) VALUES (:name, :state)"), params)
+            await db.commit()
+
+    async def close(self):
+        from core.database import engine
+        await engine.dispose()
+
+
+# --- driver --------------------------------------------------------------------------------------------
+
+def _check_checkpoint(state: Dict[str, Any], name: str, inputs: List[Path]) -> Dict[str, Any]:
+    if state["inputs"] != [str(p) for p in inputs]:
+        raise SystemExit(f"Checkpoint {name} was written for different inputs: {state['inputs']}")
+    return state
+
+
+def _save_checkpoint(path: Path, state: Dict[str, Any]):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path)
+
+
+def _batches(messages, size: int):
+    batch = []
+    for source, key, resume, raw in messages:
+        batch.append((source, key, resume, raw))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run(args) -> Dict[str, Any]:
+    inputs = [Path(p).resolve() for p in args.inputs]
+    checkpoint = Path(args.checkpoint)
+    state = {"inputs": [str(p) for p in inputs], "source": 0, "position": 0, "processed": 0, "errors": 0,
+             "output_bytes": 0}
+    if args.db:
+        writer = DatabaseWriter(args.user_id, str(checkpoint))
+    else:
+        writer = JsonlWriter(Path(args.output), checkpoint, args.include_body)
+    saved = await writer.open(args.resume)
+    if saved is not None:
+        state = _check_checkpoint(saved, str(checkpoint), inputs)
+        print(f"[+] Resuming after {state['processed']} messages", file=sys.stderr)
+
+    workers = args.workers or os.cpu_count() or 1
+    max_in_flight = args.max_in_flight or workers * 2
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+    started = last_report = time.perf_counter()
+    done_since_start = 0
+
+    async def complete(future, source: int, resume: Union[int, str]):
+        nonlocal last_report, done_since_start
+        records = await future
+        state.update(source=source, position=resume, processed=state["processed"] + len(records),
+                     errors=state["errors"] + sum(1 for r in records if "error" in r))
+        await writer.write(records, state)
+        done_since_start += len(records)
+        now = time.perf_counter()
+        if now - last_report >= args.progress_every:
+            last_report = now
+            print(f"[+] {state['processed']:,} messages, {done_since_start / (now - started):,.0f}/s, "
+                  f"{state['errors']} errors", file=sys.stderr)
+
+    # Futures complete in submission order, so the checkpoint never passes a batch that is not written yet;
+    # at most max_in_flight batches of raw mail are held in memory.
+    in_flight = deque()
+    try:
+        for batch in _batches(iter_messages(inputs, state["source"], state["position"]), args.batch_size):
+            if len(in_flight) >= max_in_flight:
+                await complete(*in_flight.popleft())
+            future = loop.run_in_executor(executor, _classify_messages, [(key, raw) for _, key, _, raw in batch])
+            in_flight.append((future, batch[-1][0], batch[-1][2]))
+        while in_flight:
+            await complete(*in_flight.popleft())
+    finally:
+        for future, _, _ in in_flight:
+            future.cancel()
+        executor.shutdown(cancel_futures=True)
+        await writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"[+] Done: {state['processed']:,} messages ({state['errors']} errors) in {elapsed:.1f}s, "
+          f"{done_since_start / max(elapsed, 1e-9):,.0f}/s", file=sys.stderr)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Classify archived mail (mbox files, Maildir or .eml directories) with MailAnalyzer.")
+    parser.add_argument("inputs", nargs="+", help="mbox files, Maildir directories, .eml files or directories.")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--output", help="Write one JSON object per message to this JSONL file.")
+    output.add_argument("--db", action="store_true",
+                        help="Insert into the emails table (see --user-id); the checkpoint is kept in the database.")
+    parser.add_argument("--user-id", type=int, help="Owner of the inserted emails with --db.")
+    parser.add_argument("--include-body", action="store_true", help="Keep message bodies in the JSONL output.")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: one per core).")
+    parser.add_argument("--batch-size", type=int, default=256, help="Messages per worker task.")
+    parser.add_argument("--max-in-flight", type=int, default=0, help="Batches queued at once (default: 2 x workers).")
+    parser.add_argument("--checkpoint",
+                        help="Checkpoint file, or its name in the database with --db "
+                             "(default: <output>.checkpoint or bulk_classify.checkpoint).")
+    parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint file.")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="Seconds between progress lines.")
+    args = parser.parse_args()
+    if args.db and args.user_id is None:
+        parser.error("--db requires --user-id")
+    if not args.checkpoint:
+        args.checkpoint = f"{args.output}.checkpoint" if args.output else "bulk_classify.checkpoint"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+
+from sqlalchemy import text
+
+from core.config import settings
+from core.database import engine, add_missing_columns
+from emails.compression import prepare_body
+from emails.models import Email
+from emails.search import ensure_search_index, reindex_emails
+
+
+async def migrate(batch_size: int, vacuum: bool) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(add_missing_columns, Email.__table__)
+        await ensure_search_index(conn)
+
+    converted = before = after = truncated = 0
+    last_id = 0
+    while True:
+        # One transaction per batch keeps locks short and lets an interrupted run resume where it stopped.
+        async with engine.begin() as conn:
+            rows = (await conn.execute(text(
+                "SELECT id, user_id, subject, body FROM emails WHERE id > :last_id AND body IS NOT NULL "
+                "AND body_compressed IS NULL ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size})).all()
+            if not rows:
+                break
+            params, cut, kept = [], [], []
+            for row in rows:
+                stored, columns = prepare_body(row.body)
+                columns["id"] = row.id
+                params.append(columns)
+                before += len(row.body.encode("utf-8"))
+                after += len(columns["body_compressed"])
+                if columns["body_truncated"]:
+                    cut.append(dict(row._mapping))
+                    kept.append(stored)
+            truncated += len(cut)
+            # The index still holds the full body; a contentless index has to be told exactly what to forget.
+            await reindex_emails(conn, cut, kept)
+            await conn.execute(text(
+                "UPDATE emails SET body = NULL, body_compressed = :body_compressed, body_codec = :body_codec, "
+                "body_size = :body_size, body_truncated = :body_truncated WHERE id = :id"
+            ), params)
+        converted += len(rows)
+        last_id = rows[-1].id
+        print(f"[+] {converted} bodies compressed (up to id {last_id})")
+
+    print(f"[+] Done: {converted} rows, {before / 1024:.1f} KB -> {after / 1024:.1f} KB, {truncated} truncated")
+    if vacuum and engine.dialect.name in ("sqlite", "postgresql"):
+        # VACUUM cannot run inside a transaction.
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM emails" if engine.dialect.name == "postgresql" else "VACUUM"))
+        print("[+] Vacuumed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move plain-text email bodies into the compressed body column.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="Reclaim the freed space afterwards.")
+    args = parser.parse_args()
+    print(f"Codec: {settings.BODY_COMPRESSION}, level: {settings.BODY_COMPRESSION_LEVEL}, "
+          f"max bytes: {settings.BODY_MAX_BYTES}")
+    asyncio.run(migrate(args.batch_size, args.vacuum))
+
+
+if __name__ == "__main__":
+    main()